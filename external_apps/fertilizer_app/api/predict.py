@@ -1,17 +1,150 @@
 from http.server import BaseHTTPRequestHandler
+import csv
+import hashlib
+import io
 import json
 import os
 import numpy as np
 
-# Load model globally to cache between requests (warm start)
-weights_path = os.path.join(os.path.dirname(__file__), 'model_weights.json')
-with open(weights_path, 'r') as f:
-    MODEL_DATA = json.load(f)
+FEATURES = ('crop', 'soil', 'moisture')
+OUTPUTS = ('nitrogen', 'phosphorus', 'potassium')
+
+# Largest batch (rows) accepted in one request
+MAX_BATCH_ROWS = int(os.environ.get('FERTILIZER_MAX_BATCH_ROWS', '200000'))
+# Largest body accepted, checked against Content-Length before it is read
+# (~128 bytes per JSON row leaves room for long moisture values and whitespace)
+MAX_BODY_BYTES = int(os.environ.get('FERTILIZER_MAX_BODY_BYTES', str(MAX_BATCH_ROWS * 128)))
+
+class BatchTooLarge(Exception):
+    pass
 
 # Helper for ReLU
 def relu(x):
     return np.maximum(0, x)
 
+def row_features(item):
+    """[crop, soil, moisture] for one input object; bad input falls back to zeros."""
+    try:
+        return [float(item.get(name, 0)) for name in FEATURES]
+    except (ValueError, TypeError, AttributeError):
+        # Handle bad input gracefully
+        return [0.0, 0.0, 0.0]
+
+class FertilizerModel:
+    """
+    The MLP as contiguous float32 arrays, built once per process: weights are
+    pre-transposed to (in, out) and the output layer and Y scalers are cut down
+    to the three outputs (N, P, K) the API returns.
+    """
+
+    def __init__(self, weights, scalers):
+        def f32(values):
+            return np.ascontiguousarray(np.asarray(values, dtype=np.float32))
+
+        # PyTorch Linear layer stores weight as (out_features, in_features)
+        self.w1 = f32(np.asarray(weights['w1']).T)      # (3, 32)
+        self.b1 = f32(weights['b1'])                    # (32,)
+        self.w2 = f32(np.asarray(weights['w2']).T)      # (32, 32)
+        self.b2 = f32(weights['b2'])                    # (32,)
+        self.w3 = f32(np.asarray(weights['w3'])[:3].T)  # (32, 3)
+        self.b3 = f32(np.asarray(weights['b3'])[:3])    # (3,)
+
+        self.X_mean = f32(np.asarray(scalers['X_mean'])[:3])
+        self.X_std  = f32(np.asarray(scalers['X_std'])[:3])
+        self.Y_mean = f32(np.asarray(scalers['Y_mean'])[:3])
+        self.Y_std  = f32(np.asarray(scalers['Y_std'])[:3])
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Prefers model_weights.npy (written by export_weights.py) over parsing
+        model_weights.json, unless the JSON has changed since the .npy was written.
+        """
+        json_path = os.path.join(directory, 'model_weights.json')
+        npy_path = os.path.join(directory, 'model_weights.npy')
+        if os.path.exists(npy_path):
+            record = np.load(npy_path)
+            if not os.path.exists(json_path) or _npy_matches_json(record, json_path):
+                return cls(record, record)
+            print(f"Warning: {npy_path} is out of date with {json_path}; loading the JSON "
+                  f"(re-run python/export_weights.py to rebuild it)")
+        with open(json_path, 'r') as f:
+            data = json.load(f)
+        return cls(data['weights'], data['scalers'])
+
+    def predict(self, inputs):
+        """Runs an (N, 3) array of [crop, soil, moisture] rows and returns (N, 3) N/P/K."""
+        # Normalize
+        x = (np.asarray(inputs, dtype=np.float32) - self.X_mean) / self.X_std
+
+        # Forward pass, one matrix multiply per layer for the whole batch
+        x = relu(x @ self.w1 + self.b1)
+        x = relu(x @ self.w2 + self.b2)
+        x = x @ self.w3 + self.b3
+        # No activation at end
+
+        # De-normalize
+        return np.maximum(x * self.Y_std + self.Y_mean, 0).astype(np.int64)
+
+def _npy_matches_json(record, json_path):
+    """True if the .npy record was exported from this exact model_weights.json."""
+    if 'json_sha256' not in (record.dtype.names or ()):
+        return False
+    with open(json_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return record['json_sha256'].item().decode() == digest
+
+# Load model globally to cache between requests (warm start)
+MODEL = FertilizerModel.load(os.path.dirname(__file__))
+
+def predict_batch(inputs):
+    return MODEL.predict(inputs)
+
+def parse_csv(text):
+    """
+    (N, 3) inputs from CSV rows; a header row may name the crop/soil/moisture columns.
+    Raises BatchTooLarge as soon as there are more than MAX_BATCH_ROWS data rows.
+    """
+    reader = (row for row in csv.reader(io.StringIO(text)) if row)
+    columns = [0, 1, 2]
+    rows = []
+    first = next(reader, None)
+    if first is not None:
+        if _is_number(first[0]):
+            rows.append(first)
+        else:
+            header = [name.strip().lower() for name in first]
+            missing = [name for name in FEATURES if name not in header]
+            if missing:
+                raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+            columns = [header.index(name) for name in FEATURES]
+
+    for row in reader:
+        if len(rows) >= MAX_BATCH_ROWS:
+            raise BatchTooLarge(f'Batch too large: more than {MAX_BATCH_ROWS} rows')
+        rows.append(row)
+
+    inputs = np.zeros((len(rows), 3), dtype=np.float32)
+    for i, row in enumerate(rows):
+        try:
+            inputs[i] = [float(row[c]) for c in columns]
+        except (ValueError, IndexError):
+            pass  # bad rows stay at zeros, like bad single requests
+    return inputs
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+def to_csv(results):
+    buffer = io.StringIO()
+    buffer.write(','.join(OUTPUTS) + '\n')
+    np.savetxt(buffer, results, fmt='%d', delimiter=',')
+    return buffer.getvalue()
+
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
@@ -20,82 +153,56 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
 
+    def _send(self, status, body, content_type='application/json'):
+        if content_type == 'application/json':
+            body = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
     def do_POST(self):
+        """
+        Accepts one {crop, soil, moisture} object, a JSON array of them, or a CSV
+        upload (Content-Type: text/csv). Batches come back in input order, as a JSON
+        array or as CSV for CSV uploads (unless Accept asks for JSON).
+        """
         try:
             content_length = int(self.headers.get('Content-Length', 0))
+            if content_length > MAX_BODY_BYTES:
+                # Refuse before reading, so an oversized upload is never buffered
+                self.close_connection = True
+                self._send(413, {'error': f'Request body too large: {content_length} bytes (max {MAX_BODY_BYTES})'})
+                return
             body_str = self.rfile.read(content_length).decode('utf-8')
-            body = json.loads(body_str)
-
-            # Features: crop, soil, moisture
-            try:
-                crop = float(body.get('crop', 0))
-                soil = float(body.get('soil', 0))
-                moisture = float(body.get('moisture', 0))
-            except (ValueError, TypeError):
-                 # Handle bad input gracefully
-                crop, soil, moisture = 0.0, 0.0, 0.0
-            
-            # Input vector
-            input_vec = np.array([crop, soil, moisture], dtype=np.float32)
-
-            # SCALERS
-            scalers = MODEL_DATA['scalers']
-            X_mean = np.array(scalers['X_mean'][:3], dtype=np.float32)
-            X_std  = np.array(scalers['X_std'][:3], dtype=np.float32)
-            Y_mean = np.array(scalers['Y_mean'], dtype=np.float32)
-            Y_std  = np.array(scalers['Y_std'], dtype=np.float32)
-
-            # Normalize
-            norm_input = (input_vec - X_mean) / X_std
-
-            # INFERENCE
-            w = MODEL_DATA['weights']
-            
-            # PyTorch Linear layer stores weight as (out_features, in_features)
-            # So we use X @ W.T + b
-            
-            w1 = np.array(w['w1']) # (32, 3)
-            b1 = np.array(w['b1']) # (32,)
-            
-            w2 = np.array(w['w2']) # (32, 32)
-            b2 = np.array(w['b2']) # (32,)
-            
-            w3 = np.array(w['w3']) # (6, 32)
-            b3 = np.array(w['b3']) # (6,)
-            
-            # Forward pass
-            # L1
-            x = np.dot(norm_input, w1.T) + b1
-            x = relu(x)
-            
-            # L2
-            x = np.dot(x, w2.T) + b2
-            x = relu(x)
-            
-            # L3
-            x = np.dot(x, w3.T) + b3
-            # No activation at end
-            
-            # De-normalize
-            final_output = (x * Y_std) + Y_mean
-            
-            results = final_output.tolist()
-            
-            response_data = {
-                'nitrogen': max(0, int(results[0])), 
-                'phosphorus': max(0, int(results[1])),
-                'potassium': max(0, int(results[2])),
-            }
-
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(response_data).encode('utf-8'))
 
+            if 'text/csv' in self.headers.get('Content-Type', ''):
+                inputs = parse_csv(body_str)
+                as_csv = 'application/json' not in self.headers.get('Accept', '')
+            else:
+                body = json.loads(body_str)
+                if not isinstance(body, list):
+                    # Features: crop, soil, moisture
+                    input_vec = np.array([row_features(body)], dtype=np.float32)
+                    results = predict_batch(input_vec)[0].tolist()
+                    self._send(200, dict(zip(OUTPUTS, results)))
+                    return
+                if len(body) > MAX_BATCH_ROWS:
+                    raise BatchTooLarge(f'Batch too large: {len(body)} rows (max {MAX_BATCH_ROWS})')
+                inputs = np.array([row_features(item) for item in body], dtype=np.float32).reshape(-1, 3)
+                as_csv = False
+
+            results = predict_batch(inputs)
+            if as_csv:
+                self._send(200, to_csv(results), 'text/csv')
+            else:
+                self._send(200, [dict(zip(OUTPUTS, row)) for row in results.tolist()])
+
+        except BatchTooLarge as e:
+            self._send(413, {'error': str(e)})
+        except ValueError as e:
+            # Malformed JSON or CSV body
+            self._send(400, {'error': str(e)})
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            self._send(500, {'error': str(e)})
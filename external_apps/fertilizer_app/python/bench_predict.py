@@ -0,0 +1,97 @@
+"""
+Throughput of the fertilizer recommender (api/predict.py) at different batch sizes.
+
+  direct  predict_batch() on one (N, 3) array vs N single-row calls
+  http    POST of a JSON array / CSV upload of N rows vs N single-object POSTs
+
+Run from external_apps/fertilizer_app/:  python python/bench_predict.py --sizes 1 1000 100000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import threading
+import time
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+API_PREDICT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api', 'predict.py')
+
+# Single-row loops beyond this many rows are timed on a sample and extrapolated
+MAX_LOOP_ROWS = 2000
+
+def load_api():
+    spec = importlib.util.spec_from_file_location('fertilizer_api', API_PREDICT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def random_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(0, 5, n),     # crop
+        rng.integers(0, 5, n),     # soil
+        rng.uniform(10, 90, n),    # moisture
+    ]).astype(np.float32)
+
+def rows_per_sec(fn, rows, repeat):
+    fn()  # warm-up
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+def post(url, body, content_type):
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+def bench_direct(api, sizes, repeat):
+    print(f"\n{'direct':<8} {'N':>8} {'batch rows/s':>14} {'loop rows/s':>13} {'speedup':>8}")
+    for n in sizes:
+        inputs = random_inputs(n)
+        batch = rows_per_sec(lambda: api.predict_batch(inputs), n, repeat)
+        sample = inputs[:min(n, MAX_LOOP_ROWS)]
+        loop = rows_per_sec(lambda: [api.predict_batch(row[None, :]) for row in sample], len(sample), 1)
+        print(f"{'':<8} {n:>8} {batch:>14,.0f} {loop:>13,.0f} {batch / loop:>7.1f}x")
+
+def bench_http(api, sizes, repeat):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), api.handler)
+    server.RequestHandlerClass.log_message = lambda *args: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/'
+
+    print(f"\n{'http':<8} {'N':>8} {'json rows/s':>14} {'csv rows/s':>13} {'single rows/s':>14}")
+    try:
+        for n in sizes:
+            inputs = random_inputs(n)
+            items = [dict(zip(api.FEATURES, row)) for row in inputs.tolist()]
+            json_body = json.dumps(items).encode('utf-8')
+            csv_body = ('crop,soil,moisture\n' + '\n'.join(','.join(map(str, row)) for row in inputs.tolist())).encode('utf-8')
+            as_json = rows_per_sec(lambda: post(url, json_body, 'application/json'), n, repeat)
+            as_csv = rows_per_sec(lambda: post(url, csv_body, 'text/csv'), n, repeat)
+
+            singles = [json.dumps(item).encode('utf-8') for item in items[:min(n, MAX_LOOP_ROWS)]]
+            single = rows_per_sec(lambda: [post(url, body, 'application/json') for body in singles], len(singles), 1)
+            print(f"{'':<8} {n:>8} {as_json:>14,.0f} {as_csv:>13,.0f} {single:>14,.0f}")
+    finally:
+        server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 1000, 100000])
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per size (best is reported)')
+    parser.add_argument('--skip-http', action='store_true', help='only time predict_batch() in-process')
+    args = parser.parse_args()
+
+    api = load_api()
+    bench_direct(api, args.sizes, args.repeat)
+    if not args.skip_http:
+        bench_http(api, args.sizes, args.repeat)
+
+if __name__ == '__main__':
+    main()
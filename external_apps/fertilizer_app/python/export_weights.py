@@ -1,7 +1,9 @@
 
 import torch
+import hashlib
 import json
 import os
+import sys
 import numpy as np
 
 def export_model():
@@ -74,5 +76,33 @@ def export_model():
     
     print(f"Successfully exported weights to {output_path}")
 
+    write_npy(output_path)
+
+def write_npy(json_path):
+    """
+    Writes the arrays of an exported model_weights.json next to it as one float32
+    .npy record (a field per array, shapes in the header); api/predict.py loads
+    this when present so serverless cold starts skip parsing the JSON. The JSON's
+    SHA-256 is stored with them, so a JSON re-exported without rewriting the .npy
+    is detected and used instead.
+    """
+    with open(json_path, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw)
+
+    arrays = {k: np.asarray(v, dtype=np.float32) for k, v in {**data['weights'], **data['scalers']}.items()}
+    record = np.zeros((), dtype=[(k, np.float32, a.shape) for k, a in arrays.items()] + [('json_sha256', 'S64')])
+    for k, a in arrays.items():
+        record[k] = a
+    record['json_sha256'] = hashlib.sha256(raw).hexdigest()
+    npy_path = os.path.splitext(json_path)[0] + '.npy'
+    np.save(npy_path, record)
+
+    print(f"Successfully exported weights to {npy_path}")
+
 if __name__ == "__main__":
-    export_model()
+    # python export_weights.py [path/to/model_weights.json] rebuilds just the .npy for that JSON
+    if len(sys.argv) > 1:
+        write_npy(sys.argv[1])
+    else:
+        export_model()
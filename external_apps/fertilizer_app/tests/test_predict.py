@@ -0,0 +1,64 @@
+import importlib.util
+import json
+import os
+import shutil
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(APP_DIR, 'api')
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+api = load_module('fertilizer_api', os.path.join(API_DIR, 'predict.py'))
+
+INPUTS = np.array([[1, 2, 40], [0, 4, 75]], dtype=np.float32)
+
+
+def copy_weights(tmp_path):
+    for name in ('model_weights.json', 'model_weights.npy'):
+        shutil.copy(os.path.join(API_DIR, name), tmp_path / name)
+
+
+def test_npy_matches_the_committed_json(tmp_path):
+    copy_weights(tmp_path)
+    (tmp_path / 'model_weights.npy').unlink()
+    from_json = api.FertilizerModel.load(str(tmp_path)).predict(INPUTS)
+
+    assert api._npy_matches_json(np.load(os.path.join(API_DIR, 'model_weights.npy')),
+                                 os.path.join(API_DIR, 'model_weights.json'))
+    np.testing.assert_array_equal(api.MODEL.predict(INPUTS), from_json)
+
+
+def test_rewritten_json_is_used_over_a_stale_npy(tmp_path, capsys):
+    copy_weights(tmp_path)
+    before = api.FertilizerModel.load(str(tmp_path)).predict(INPUTS)
+
+    # Retrained weights written without re-running export_weights.py
+    with open(tmp_path / 'model_weights.json') as f:
+        data = json.load(f)
+    data['scalers']['Y_mean'] = [value + 100 for value in data['scalers']['Y_mean']]
+    with open(tmp_path / 'model_weights.json', 'w') as f:
+        json.dump(data, f)
+
+    after = api.FertilizerModel.load(str(tmp_path)).predict(INPUTS)
+    np.testing.assert_array_equal(after, before + 100)
+    assert 'out of date' in capsys.readouterr().out
+
+
+def test_npy_without_a_json_hash_is_treated_as_stale(tmp_path):
+    copy_weights(tmp_path)
+    record = np.load(tmp_path / 'model_weights.npy')
+    fields = [name for name in record.dtype.names if name != 'json_sha256']
+    old = np.zeros((), dtype=[(name, np.float32, record[name].shape) for name in fields])
+    for name in fields:
+        old[name] = record[name] * 0  # would predict only zeros if it were used
+    np.save(tmp_path / 'model_weights.npy', old)
+
+    np.testing.assert_array_equal(api.FertilizerModel.load(str(tmp_path)).predict(INPUTS), api.MODEL.predict(INPUTS))
@@ -0,0 +1,142 @@
+"""
+Scores every image under a folder (e.g. a drone or phone field survey) with the
+crop disease model and writes one row per image to CSV or Parquet.
+
+Images are decoded by DataLoader worker processes (--workers) with the same
+preprocessing as /predict (PREPROCESS_MODE) and run through the model in
+batches. If the folder uses per-class subfolders named after the model's
+classes, accuracy, per-class precision/recall and the confusion matrix are
+reported as well.
+
+Run from python_backend/:
+  python batch_diagnose.py survey/ --output survey_results.csv --workers 4
+  python batch_diagnose.py holdout/ --output results.parquet --confusion-output confusion.csv
+"""
+import argparse
+import csv
+import os
+import time
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from image_processing import MODEL_INPUT_SIZE, find_images, preprocess_image
+from model_loader import BACKENDS, load_serving_model
+
+COLUMNS = ["path", "true_class", "predicted_class", "confidence", "top_classes", "error"]
+
+
+class SurveyImages(Dataset):
+    """Decodes one survey image per item; unreadable files yield a blank tensor and their error."""
+
+    def __init__(self, items):
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        path, _ = self.items[index]
+        try:
+            with open(path, "rb") as f:
+                return preprocess_image(f.read()), index, ""
+        except Exception as e:
+            return torch.zeros(3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), index, str(e) or type(e).__name__
+
+
+def write_rows(rows, path: str):
+    if path.endswith(".parquet"):
+        try:
+            import pandas as pd
+        except ImportError:
+            raise SystemExit("Parquet output needs pandas and pyarrow: pip install pandas pyarrow")
+        pd.DataFrame(rows, columns=COLUMNS).to_parquet(path, index=False)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def confusion_report(confusion, class_names, output: str = None):
+    total = sum(sum(row) for row in confusion)
+    correct = sum(confusion[i][i] for i in range(len(class_names)))
+    print(f"\nAccuracy: {100 * correct / total:.2f}% on {total} labelled images")
+    print(f"{'class':<28} {'precision':>9} {'recall':>7} {'f1':>6} {'support':>8}")
+    for i, name in enumerate(class_names):
+        support = sum(confusion[i])
+        predicted = sum(row[i] for row in confusion)
+        precision = confusion[i][i] / predicted if predicted else 0.0
+        recall = confusion[i][i] / support if support else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        if support or predicted:
+            print(f"{name:<28} {precision:>9.3f} {recall:>7.3f} {f1:>6.3f} {support:>8}")
+
+    if output:
+        with open(output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["true \\ predicted"] + class_names)
+            for name, row in zip(class_names, confusion):
+                writer.writerow([name] + row)
+        print(f"Confusion matrix written to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("folder")
+    parser.add_argument("--output", default="diagnosis_results.csv", help=".csv or .parquet")
+    parser.add_argument("--checkpoint", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "crop_disease_model.pth"))
+    parser.add_argument("--backend", default=os.getenv("MODEL_BACKEND", "eager"), choices=BACKENDS)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--confusion-output", help="write the confusion matrix as CSV")
+    args = parser.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() and args.backend == "eager" else "cpu"
+    model, class_names = load_serving_model(args.checkpoint, args.backend, device)
+    items = find_images(args.folder, class_names)
+    if not items:
+        raise SystemExit(f"No images found under {args.folder}")
+    print(f"Scoring {len(items)} images with {args.backend} on {device} "
+          f"({args.workers} loader workers, batch size {args.batch_size})")
+
+    loader = DataLoader(SurveyImages(items), batch_size=args.batch_size, num_workers=args.workers,
+                        pin_memory=device == "cuda")
+    k = min(args.top_k, len(class_names))
+    confusion = [[0] * len(class_names) for _ in class_names]
+    rows, forward_seconds = [], 0.0
+
+    started = time.perf_counter()
+    with torch.no_grad():
+        for batch, indices, errors in loader:
+            forward_started = time.perf_counter()
+            probs = torch.softmax(model(batch.to(device)), dim=1)
+            top_probs, top_idxs = probs.topk(k, dim=1)
+            top_probs, top_idxs = top_probs.mul_(100).tolist(), top_idxs.tolist()
+            forward_seconds += time.perf_counter() - forward_started
+
+            for index, error, scores, idxs in zip(indices.tolist(), errors, top_probs, top_idxs):
+                path, label = items[index]
+                row = {"path": path, "true_class": class_names[label] if label is not None else "",
+                       "predicted_class": "", "confidence": None, "top_classes": "", "error": error}
+                if not error:
+                    row["predicted_class"] = class_names[idxs[0]]
+                    row["confidence"] = round(scores[0], 2)
+                    row["top_classes"] = ";".join(f"{class_names[i]}:{s:.2f}" for i, s in zip(idxs, scores))
+                    if label is not None:
+                        confusion[label][idxs[0]] += 1
+                rows.append(row)
+    elapsed = time.perf_counter() - started
+
+    write_rows(rows, args.output)
+    failed = sum(1 for row in rows if row["error"])
+    print(f"Wrote {len(rows)} rows to {args.output} ({failed} unreadable)")
+    print(f"{len(rows) / elapsed:.1f} images/sec ({elapsed:.1f}s total, {forward_seconds:.1f}s in forward passes)")
+
+    if any(any(row) for row in confusion):
+        confusion_report(confusion, class_names, args.confusion_output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Cold-start benchmark: time to `import main`, to the first /healthz response and
+to /readyz reporting ready (model loaded and warmed up), each in a fresh Python
+process. Lists the heaviest modules main imports directly (from -X importtime).
+
+Use --output to save the result and --baseline to fail when the median import
+time regresses by more than --tolerance against a saved result.
+
+Run from python_backend/:  python benchmarks/bench_cold_start.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.get("/healthz")
+    live = time.perf_counter()
+    ready = None
+    while time.perf_counter() - started < {timeout}:
+        response = client.get("/readyz")
+        if response.status_code == 200:
+            ready = time.perf_counter()
+            break
+        if response.json()["checks"]["model"] == "failed":
+            break
+        time.sleep(0.02)
+print(json.dumps({{
+    "import_s": imported - started,
+    "live_s": live - started,
+    "ready_s": ready - started if ready else None,
+    "model_state": main.model_registry.state(),
+}}))
+"""
+
+
+def heaviest_imports(importtime: str, top: int):
+    """Direct imports of main by cumulative microseconds, from -X importtime output."""
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((depth, int(cumulative), name.strip()))
+    # importtime prints children before their parent, so walk back from main's row
+    main_row = max(i for i, row in enumerate(rows) if row[2] == "main")
+    main_depth = rows[main_row][0]
+    children = []
+    for depth, cumulative, name in reversed(rows[:main_row]):
+        if depth <= main_depth:
+            break
+        if depth == main_depth + 1:
+            children.append((cumulative, name))
+    return sorted(children, reverse=True)[:top]
+
+
+def run_once(timeout: float, env: dict):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(timeout=timeout)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        sys.exit(f"Child process failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result, proc.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for /readyz")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="write the summary as JSON")
+    parser.add_argument("--baseline", help="JSON summary from an earlier --output run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed import-time regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, DB_NAME=os.path.join(tmp, "cold_start.db"), SMS_TRANSPORT="fake")
+
+    results, importtime = [], ""
+    for i in range(args.runs):
+        result, importtime = run_once(args.timeout, env)
+        results.append(result)
+        ready = f"{result['ready_s']:.2f}s" if result["ready_s"] is not None else f"never ({result['model_state']})"
+        print(f"run {i + 1}: import {result['import_s']:.2f}s, live {result['live_s']:.2f}s, ready {ready}")
+
+    ready_times = [r["ready_s"] for r in results if r["ready_s"] is not None]
+    summary = {
+        "import_s": round(statistics.median(r["import_s"] for r in results), 3),
+        "live_s": round(statistics.median(r["live_s"] for r in results), 3),
+        "ready_s": round(statistics.median(ready_times), 3) if ready_times else None,
+    }
+    print(f"\nmedian: {summary}")
+    print("\nheaviest imports of main (cumulative):")
+    for cumulative, name in heaviest_imports(importtime, args.top):
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        limit = baseline["import_s"] * (1 + args.tolerance)
+        if summary["import_s"] > limit:
+            sys.exit(f"Import time regressed: {summary['import_s']}s > {limit:.3f}s (baseline {baseline['import_s']}s)")
+
+
+if __name__ == "__main__":
+    main()
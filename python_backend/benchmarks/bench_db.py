@@ -0,0 +1,108 @@
+"""
+Requests/sec for the login and soil-log paths: per-request sqlite3.connect in
+rollback-journal mode (the old endpoints) vs. the pooled WAL connections in
+database.py.
+
+Run from python_backend/:  python benchmarks/bench_db.py [--threads 8] [--requests 5000]
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database  # noqa: E402
+
+SOIL_INSERT = '''
+    INSERT INTO soil_memory (user_phone, test_date, ph_level, nitrogen, phosphorus, potassium, moisture, notes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def seed(path: str, farmers: int):
+    database.DB_NAME = path
+    database.init_db()
+    with database.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (name, phone, location, community, member_since) VALUES (?, ?, ?, ?, ?)",
+            ((f"Farmer {i}", f"9{i:09d}", "Erode", "Erode Farmers", "2025-01-01") for i in range(farmers)),
+        )
+    database.close_all()
+    # The old code path ran with the default rollback journal
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+
+
+# --- Old endpoints: a fresh connection per request ---
+
+def login_before(path, phone):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE phone = ?", (phone,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+
+def soil_before(path, phone):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    today = datetime.date.today().isoformat()
+    cursor.execute(SOIL_INSERT, (phone, today, 6.5, 40, 20, 30, 18, ""))
+    conn.commit()
+    conn.close()
+
+
+# --- New endpoints: pooled per-thread connections ---
+
+def login_after(path, phone):
+    return database.get_connection().execute("SELECT * FROM users WHERE phone = ?", (phone,)).fetchone()
+
+
+def soil_after(path, phone):
+    today = datetime.date.today().isoformat()
+    with database.transaction() as conn:
+        conn.execute(SOIL_INSERT, (phone, today, 6.5, 40, 20, 30, 18, ""))
+
+
+def run(fn, path, farmers, requests, threads):
+    phones = [f"9{random.randrange(farmers):09d}" for _ in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda phone: fn(path, phone), phones))
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--farmers", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, args.farmers)
+
+        results = {}
+        for name, fn in (("login", login_before), ("soil_log", soil_before)):
+            results[name] = [run(fn, path, args.farmers, args.requests, args.threads)]
+
+        database.DB_NAME = path
+        for name, fn in (("login", login_after), ("soil_log", soil_after)):
+            results[name].append(run(fn, path, args.farmers, args.requests, args.threads))
+        database.close_all()
+
+    print(f"{'path':<10} {'before req/s':>14} {'after req/s':>14} {'speedup':>9}")
+    for name, (before, after) in results.items():
+        print(f"{name:<10} {before:>14.0f} {after:>14.0f} {after / before:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
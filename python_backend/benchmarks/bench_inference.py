@@ -0,0 +1,173 @@
+"""
+Inference regression benchmark for the crop disease serving path, on a
+randomly initialized MobileNetV2 so it runs without the real checkpoint:
+
+  preprocess_*    /predict preprocessing of one 1600x1200 JPEG (PREPROCESS_MODE)
+  forward_*       batch-1 forward latency through main.predict_with
+  throughput_bN   images/sec for forwards at batch size N
+  http_*          end-to-end POST /predict latency through the FastAPI test client
+  peak_rss_mb     peak resident memory of the whole run
+
+Writes the metrics as JSON (--output). With --baseline, compares against a
+saved result and exits non-zero when a metric regresses by more than
+--threshold (latency/memory up, throughput down).
+
+Run from python_backend/:
+  python benchmarks/bench_inference.py --output baseline.json
+  python benchmarks/bench_inference.py --baseline baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Metrics where bigger numbers are better; everything else is a cost
+HIGHER_IS_BETTER = ("throughput_",)
+
+
+def percentiles(samples, prefix: str) -> dict:
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]  # noqa: E731
+    return {f"{prefix}_p50_ms": round(pick(0.50), 3), f"{prefix}_p95_ms": round(pick(0.95), 3),
+            f"{prefix}_p99_ms": round(pick(0.99), 3)}
+
+
+def timed(fn, iterations: int, warmup: int = 3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def synthetic_setup(workdir: str, num_classes: int) -> bytes:
+    """Saves a random MobileNetV2 checkpoint plus registry manifest and returns a test JPEG."""
+    import torch
+    from model_loader import build_model
+
+    torch.manual_seed(0)
+    model = build_model(num_classes)
+    checkpoint = os.path.join(workdir, "bench_model.pth")
+    torch.save({"class_names": [f"class_{i}" for i in range(num_classes)], "model_state": model.state_dict()}, checkpoint)
+    with open(os.path.join(workdir, "registry.json"), "w") as f:
+        json.dump({"default": "bench", "models": {"bench": checkpoint}}, f)
+
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(60, 200, size=(1200, 1600, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp()
+    photo = synthetic_setup(workdir, args.classes)
+    os.environ.update(
+        MODEL_REGISTRY=os.path.join(workdir, "registry.json"), MODEL_WATCH_INTERVAL="0",
+        DB_NAME=os.path.join(workdir, "bench.db"), SMS_TRANSPORT="fake",
+    )
+
+    import torch
+    from fastapi.testclient import TestClient
+    import main
+    from image_processing import preprocess_image
+
+    metrics = {}
+    with TestClient(main.app) as client:
+        deadline = time.time() + 120
+        while client.get("/readyz").status_code != 200:
+            if time.time() > deadline:
+                raise SystemExit(f"Model never became ready: {main.model_registry.status()}")
+            time.sleep(0.05)
+        loaded = main.model_registry.get()
+
+        metrics.update(percentiles(timed(lambda: preprocess_image(photo), args.iterations), "preprocess"))
+
+        tensor = preprocess_image(photo)
+        metrics.update(percentiles(
+            timed(lambda: main.predict_with(loaded, [(tensor, 3)]), args.iterations), "forward"))
+
+        for size in args.batch_sizes:
+            items = [(tensor, 3)] * size
+            batch_ms = statistics.median(timed(lambda: main.predict_with(loaded, items), max(3, args.iterations // 5)))
+            metrics[f"throughput_b{size}"] = round(size / batch_ms * 1000, 2)
+
+        files = {"file": ("leaf.jpg", photo, "image/jpeg")}
+        metrics.update(percentiles(
+            timed(lambda: client.post("/predict", files=files).raise_for_status(), args.iterations), "http"))
+
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    metrics["peak_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "cpu_count": os.cpu_count(),
+            "iterations": args.iterations,
+        },
+        "metrics": metrics,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> bool:
+    ok = True
+    print(f"\n{'metric':<22} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, value in current.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        change = (value - before) / before if before else 0.0
+        worse = -change if name.startswith(HIGHER_IS_BETTER) else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        ok = ok and not flag
+        print(f"{name:<22} {before:>10} {value:>10} {change:>+7.1%}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--classes", type=int, default=38)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed regression (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    result = run(args)
+    for name, value in result["metrics"].items():
+        print(f"{name:<22} {value}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(result["metrics"], baseline["metrics"], args.threshold):
+            sys.exit(f"Regression of more than {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Latency and throughput of each crop disease serving backend (MODEL_BACKEND) on
+CPU: per-image latency at batch size 1 and images/sec at --batch-size, using
+random 224x224 inputs. Backends without an export next to the checkpoint are
+skipped; create them with model_export.py.
+
+Run from python_backend/:  python benchmarks/bench_model_backends.py
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_loader import BACKENDS, export_path, load_serving_model  # noqa: E402
+
+
+def timed(model, batch, iterations: int):
+    with torch.no_grad():
+        for _ in range(3):
+            model(batch)
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            model(batch)
+            samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--checkpoint", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "crop_disease_model.pth"))
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    single = torch.randn(1, 3, 224, 224)
+    batch = torch.randn(args.batch_size, 3, 224, 224)
+
+    print(f"{args.threads} threads, batch size {args.batch_size}")
+    print(f"{'backend':<14} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8}")
+    for backend in args.backends:
+        if backend != "eager" and not os.path.exists(export_path(args.checkpoint, backend)):
+            print(f"{backend:<14} (not exported)")
+            continue
+        model, _ = load_serving_model(args.checkpoint, backend, "cpu")
+        latencies = timed(model, single, args.iterations)
+        batch_ms = statistics.median(timed(model, batch, max(5, args.iterations // 5)))
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{backend:<14} {statistics.median(latencies):>8.2f} {p95:>8.2f} {args.batch_size / batch_ms * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
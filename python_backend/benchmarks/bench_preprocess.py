@@ -0,0 +1,92 @@
+"""
+Images/sec of each /predict preprocessing mode (PREPROCESS_MODE) across photo
+sizes, and how far the fast modes drift from the reference `pil` pipeline
+(mean and max absolute difference of the [0, 1] input tensors). Exits
+non-zero when a mode's mean difference exceeds --tolerance.
+
+Uses synthetic, photo-like JPEGs by default; pass --images-dir to use real
+uploads instead (one row for the whole folder).
+
+Run from python_backend/:  python benchmarks/bench_preprocess.py
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_processing import PREPROCESS_MODES, preprocess_image  # noqa: E402
+
+SIZES = [(640, 480), (1600, 1200), (4000, 3000)]
+
+
+def synthetic_photo(width: int, height: int, seed: int) -> bytes:
+    """Smooth gradients plus texture and noise, so it compresses like a leaf photo rather than static."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        120 + 60 * np.sin(x / width * rng.uniform(2, 6)),
+        150 + 50 * np.cos(y / height * rng.uniform(2, 6)),
+        60 + 40 * np.sin((x + y) / (width + height) * rng.uniform(4, 10)),
+    ], axis=-1)
+    base += rng.normal(0, 12, size=base.shape)
+    image = Image.fromarray(base.clip(0, 255).astype(np.uint8)).filter(ImageFilter.SMOOTH)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def measure(photos, modes, repeat: int):
+    reference = [preprocess_image(data, "pil") for data in photos]
+    rows = {}
+    for mode in modes:
+        preprocess_image(photos[0], mode)  # warm up lazy imports
+        start = time.perf_counter()
+        for _ in range(repeat):
+            outputs = [preprocess_image(data, mode) for data in photos]
+        elapsed = time.perf_counter() - start
+        diffs = [(out - ref).abs() for out, ref in zip(outputs, reference)]
+        rows[mode] = {
+            "images_per_sec": len(photos) * repeat / elapsed,
+            "mean_diff": float(sum(d.mean() for d in diffs) / len(diffs)),
+            "max_diff": float(max(d.max() for d in diffs)),
+        }
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=8, help="synthetic photos per size")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--images-dir", help="benchmark real JPEG/PNG uploads from this folder instead")
+    parser.add_argument("--modes", nargs="+", default=PREPROCESS_MODES, choices=PREPROCESS_MODES)
+    parser.add_argument("--tolerance", type=float, default=0.02, help="max mean |diff| vs pil, on the 0-1 scale")
+    args = parser.parse_args()
+
+    if args.images_dir:
+        files = sorted(os.listdir(args.images_dir))
+        groups = {args.images_dir: [open(os.path.join(args.images_dir, name), "rb").read() for name in files]}
+    else:
+        groups = {f"{w}x{h}": [synthetic_photo(w, h, seed) for seed in range(args.images)] for w, h in SIZES}
+
+    failed = False
+    print(f"{'photos':<12} {'mode':<8} {'img/s':>8} {'speedup':>8} {'mean diff':>10} {'max diff':>9}")
+    for label, photos in groups.items():
+        rows = measure(photos, args.modes, args.repeat)
+        baseline = rows.get("pil", {}).get("images_per_sec")
+        for mode, row in rows.items():
+            speedup = f"{row['images_per_sec'] / baseline:.2f}x" if baseline else "-"
+            print(f"{label:<12} {mode:<8} {row['images_per_sec']:>8.1f} {speedup:>8} "
+                  f"{row['mean_diff']:>10.4f} {row['max_diff']:>9.4f}")
+            failed = failed or row["mean_diff"] > args.tolerance
+
+    if failed:
+        sys.exit(f"A preprocessing mode drifted more than {args.tolerance} (mean |diff|) from the pil pipeline")
+
+
+if __name__ == "__main__":
+    main()
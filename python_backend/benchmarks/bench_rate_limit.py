@@ -0,0 +1,135 @@
+"""
+Load test for the auth rate limiter: latency seen by legitimate clients with no
+limiter, with the limiter and normal traffic, and with the limiter while an
+abusive client floods /auth/send-otp. Also reports per-key memory and the cost
+of a single allow() call.
+
+The middleware wraps a stand-in ASGI endpoint that holds a worker for
+--service-ms, so shed requests show up as capacity freed for real users.
+
+Run from python_backend/:  python benchmarks/bench_rate_limit.py
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rate_limiter import RateLimitMiddleware, TokenBucketLimiter  # noqa: E402
+
+
+def make_endpoint(service_ms: float, workers: int):
+    # Mimics FastAPI's bounded threadpool: at most `workers` requests in progress
+    slots = asyncio.Semaphore(workers)
+
+    async def endpoint(scope, receive, send):
+        async with slots:
+            await asyncio.sleep(service_ms / 1000)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    return endpoint
+
+
+async def request(app, ip: str) -> tuple:
+    scope = {"type": "http", "path": "/auth/send-otp", "client": (ip, 1234), "headers": []}
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    return status["code"], (time.perf_counter() - start) * 1000
+
+
+async def scenario(app, duration: float, legit_clients: int, legit_rps: float, flood_rps: float):
+    latencies, shed = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def legit(i):
+        while time.perf_counter() < deadline:
+            code, ms = await request(app, f"10.0.0.{i}")
+            if code == 200:
+                latencies.append(ms)
+            await asyncio.sleep(1 / legit_rps)
+
+    async def attacker():
+        nonlocal shed
+        tasks = []
+        while time.perf_counter() < deadline:
+            tasks.append(asyncio.ensure_future(request(app, "6.6.6.6")))
+            await asyncio.sleep(1 / flood_rps)
+        for code, _ in await asyncio.gather(*tasks):
+            shed += code == 429
+
+    jobs = [legit(i) for i in range(legit_clients)]
+    if flood_rps:
+        jobs.append(attacker())
+    await asyncio.gather(*jobs)
+
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "served": len(latencies),
+        "shed": shed,
+    }
+
+
+def micro(keys: int):
+    phones = [f"9{i:09d}" for i in range(keys)]
+
+    limiter = TokenBucketLimiter(capacity=20, refill_per_sec=20 / 60, max_keys=keys * 2)
+    start = time.perf_counter()
+    for phone in phones:
+        limiter.allow(phone)
+    elapsed = time.perf_counter() - start
+
+    limiter = TokenBucketLimiter(capacity=20, refill_per_sec=20 / 60, max_keys=keys * 2)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for phone in phones:
+        limiter.allow(phone)
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    print(f"allow(): {elapsed / keys * 1e6:.2f} us/call, ~{used / keys:.0f} bytes/key over {keys} keys")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--legit-clients", type=int, default=20)
+    parser.add_argument("--legit-rps", type=float, default=2, help="requests/sec per legitimate client")
+    parser.add_argument("--flood-rps", type=float, default=3000)
+    parser.add_argument("--service-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=40)
+    args = parser.parse_args()
+
+    micro(100000)
+
+    def limited():
+        limiter = TokenBucketLimiter(capacity=20, refill_per_sec=20 / 60)
+        return RateLimitMiddleware(make_endpoint(args.service_ms, args.workers), limiter, ["/auth/send-otp"])
+
+    runs = {
+        "no limiter, normal traffic": (lambda: make_endpoint(args.service_ms, args.workers), 0),
+        "no limiter, under flood": (lambda: make_endpoint(args.service_ms, args.workers), args.flood_rps),
+        "limiter, normal traffic": (limited, 0),
+        "limiter, under flood": (limited, args.flood_rps),
+    }
+    print(f"{'scenario':<28} {'p50 ms':>8} {'p99 ms':>8} {'served':>7} {'shed':>6}")
+    for name, (build, flood) in runs.items():
+        result = asyncio.run(scenario(build(), args.duration, args.legit_clients, args.legit_rps, flood))
+        print(f"{name:<28} {result['p50']:>8.2f} {result['p99']:>8.2f} {result['served']:>7} {result['shed']:>6}")
+
+
+if __name__ == "__main__":
+    main()
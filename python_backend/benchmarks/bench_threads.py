@@ -0,0 +1,77 @@
+"""
+Throughput of N uvicorn-like worker processes each running MobileNetV2 forwards
+with different torch intra-op thread counts, to pick WEB_CONCURRENCY and
+TORCH_NUM_THREADS for a box. `all` is torch's default (every core in every
+worker, which oversubscribes); `auto` is the backend's default of cores/workers.
+
+Run from python_backend/:  python benchmarks/bench_threads.py --workers 1 2 4
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from torch_threads import available_cores, resolve_threads  # noqa: E402
+
+
+def worker(threads: int, batch_size: int, duration: float, barrier, results):
+    import torch
+    from model_loader import build_model
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    model = build_model(38).eval()
+    batch = torch.randn(batch_size, 3, 224, 224)
+    with torch.no_grad():
+        model(batch)
+        barrier.wait()
+        latencies = []
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            model(batch)
+            latencies.append((time.perf_counter() - start) * 1000)
+    results.put((len(latencies) * batch_size, statistics.median(latencies)))
+
+
+def run(workers: int, threads: int, batch_size: int, duration: float):
+    ctx = multiprocessing.get_context("spawn")
+    barrier, results = ctx.Barrier(workers), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(threads, batch_size, duration, barrier, results)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    outcomes = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    images = sum(count for count, _ in outcomes)
+    return images / duration, statistics.median(p50 for _, p50 in outcomes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", nargs="+", default=["1", "2", "auto", "all"],
+                        help="intra-op threads per worker: a number, auto or all")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per setting")
+    args = parser.parse_args()
+
+    cores = available_cores()
+    print(f"{cores} cores, batch size {args.batch_size}, {args.duration}s per setting")
+    print(f"{'workers':>7} {'threads':>12} {'total':>6} {'img/s':>8} {'p50 ms':>8}")
+    for workers in args.workers:
+        labels = {}
+        for setting in args.threads:
+            threads = cores if setting == "all" else resolve_threads(setting, workers)
+            labels.setdefault(threads, []).extend([setting] if setting in ("auto", "all") else [])
+        for threads, names in labels.items():
+            throughput, p50 = run(workers, threads, args.batch_size, args.duration)
+            label = f"{threads}" + (f" ({'/'.join(names)})" if names else "")
+            print(f"{workers:>7} {label:>12} {workers * threads:>6} {throughput:>8.1f} {p50:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import database
+from stats_service import StatsService
+
+CHANNELS = ("sms", "whatsapp")
+
+
+class BroadcastService:
+    """
+    Fans one alert out to every farmer matching a location/community filter.
+
+    Recipients are snapshotted into `broadcast_recipients` when the broadcast is
+    created and each one is marked sent/failed as soon as its send returns, so a
+    broadcast interrupted by a crash resumes with only the pending recipients
+    (at most the in-flight sends, i.e. `concurrency` messages, can repeat).
+    Sends run on a thread pool of `concurrency` workers, paced to `max_rate`
+    messages per second.
+
+    Every uvicorn worker runs one of these, so a run is claimed in the database
+    (owner + heartbeat) before it starts and only one process sends a broadcast
+    at a time. The owner refreshes the heartbeat while sending; a run whose
+    heartbeat is older than BROADCAST_CLAIM_TIMEOUT seconds (its process died) is
+    taken over by the next `resume_incomplete()` sweep in any worker.
+    """
+
+    def __init__(self, notification_service, max_concurrency: Optional[int] = None, max_rate: Optional[float] = None):
+        self.notification_service = notification_service
+        self.max_concurrency = max_concurrency or int(os.getenv("BROADCAST_MAX_CONCURRENCY", "16"))
+        self.max_rate = max_rate or float(os.getenv("BROADCAST_MAX_RATE", "50"))
+        self.claim_timeout = float(os.getenv("BROADCAST_CLAIM_TIMEOUT", "60"))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._whatsapp_service = None
+        self._sweeper = None
+        self._stop = threading.Event()
+        self._runs = {}  # broadcast_id -> {"started": monotonic time, "processed": count} for this process
+        self._lock = threading.Lock()
+
+    def _whatsapp(self):
+        # Selenium is heavy and only needed for WhatsApp broadcasts
+        if self._whatsapp_service is None:
+            from whatsapp_service import WhatsAppService
+            self._whatsapp_service = WhatsAppService()
+        return self._whatsapp_service
+
+    def create(self, message: str, channel: str = "sms", location: Optional[str] = None,
+               community: Optional[str] = None, concurrency: Optional[int] = None,
+               max_rate: Optional[float] = None) -> dict:
+        if channel not in CHANNELS:
+            raise ValueError(f"channel must be one of {', '.join(CHANNELS)}")
+        if concurrency is not None and concurrency <= 0:
+            raise ValueError("concurrency must be positive")
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError("max_rate must be positive")
+
+        # The WhatsApp Web driver is a single browser session, so it can't send in parallel
+        concurrency = 1 if channel == "whatsapp" else min(concurrency or self.max_concurrency, self.max_concurrency)
+        max_rate = min(max_rate or self.max_rate, self.max_rate)
+
+        conditions = ["role = 'farmer'"]
+        params = []
+        if location:
+            conditions.append("location = ?")
+            params.append(location)
+        if community:
+            conditions.append("community = ?")
+            params.append(community)
+
+        with database.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO broadcasts (channel, message, location, community, concurrency, max_rate, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)
+            ''', (channel, message, location, community, concurrency, max_rate, time.time()))
+            broadcast_id = cursor.lastrowid
+            cursor = conn.execute(f'''
+                INSERT INTO broadcast_recipients (broadcast_id, phone)
+                SELECT ?, phone FROM users WHERE {' AND '.join(conditions)}
+            ''', [broadcast_id] + params)
+            conn.execute("UPDATE broadcasts SET total = ? WHERE id = ?", (cursor.rowcount, broadcast_id))
+            StatsService.increment(conn, "pending_alerts")
+
+        self._start(broadcast_id)
+        return self.progress(broadcast_id)
+
+    def resume_incomplete(self):
+        """Starts queued broadcasts and takes over running ones whose owner stopped heartbeating."""
+        rows = database.get_connection().execute(
+            "SELECT id, status FROM broadcasts WHERE status = 'queued' OR (status = 'running' AND "
+            "(heartbeat IS NULL OR heartbeat < ?))",
+            (time.time() - self.claim_timeout,)
+        ).fetchall()
+        for row in rows:
+            if self._start(row["id"]) and row["status"] == "running":
+                print(f"Resuming broadcast {row['id']}")
+
+    def start(self):
+        """Resumes interrupted broadcasts now and keeps sweeping for stale ones."""
+        if self._sweeper:
+            return
+        self.resume_incomplete()
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.claim_timeout / 2):
+                try:
+                    self.resume_incomplete()
+                except Exception as e:
+                    print(f"Broadcast sweep error: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="broadcast-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sweeper = None
+
+    def _claim(self, broadcast_id: int) -> bool:
+        """Atomically takes ownership of a queued broadcast or one whose owner went stale."""
+        now = time.time()
+        with database.transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE broadcasts SET status = 'running', owner = ?, heartbeat = ?,
+                                      started_at = COALESCE(started_at, ?)
+                WHERE id = ? AND (status = 'queued' OR
+                                  (status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)))
+            ''', (self.owner, now, now, broadcast_id, now - self.claim_timeout))
+        return cursor.rowcount == 1
+
+    def _start(self, broadcast_id: int) -> bool:
+        with self._lock:
+            if broadcast_id in self._runs:
+                return False
+            if not self._claim(broadcast_id):
+                return False
+            self._runs[broadcast_id] = {"started": time.monotonic(), "processed": 0}
+        threading.Thread(target=self._run, args=(broadcast_id,), name=f"broadcast-{broadcast_id}", daemon=True).start()
+        return True
+
+    def _heartbeat(self, broadcast_id: int, done: threading.Event, lost: threading.Event):
+        """Refreshes the claim until `done`; sets `lost` if another process took the broadcast over."""
+        conn = database.connect()
+        try:
+            while not done.wait(self.claim_timeout / 4):
+                with conn:
+                    cursor = conn.execute(
+                        "UPDATE broadcasts SET heartbeat = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                        (time.time(), broadcast_id, self.owner)
+                    )
+                if cursor.rowcount == 0:
+                    print(f"Lost the claim on broadcast {broadcast_id}; stopping")
+                    lost.set()
+                    return
+        finally:
+            conn.close()
+
+    def _send(self, broadcast: dict, phone: str, connection):
+        # Farmers are stored with 10-digit numbers; assume India (+91) as send-otp does
+        target_phone = "91" + phone
+        error = None
+        try:
+            if broadcast["channel"] == "whatsapp":
+                if not self._whatsapp().send_message(target_phone, broadcast["message"]):
+                    error = "WhatsApp send failed"
+            else:
+                self.notification_service.deliver(target_phone, broadcast["message"])
+        except Exception as e:
+            error = str(e)
+
+        counter = "failed" if error else "sent"
+        with connection() as conn:
+            cursor = conn.execute('''
+                UPDATE broadcast_recipients SET status = ?, error = ?
+                WHERE broadcast_id = ? AND phone = ? AND status = 'pending'
+            ''', (counter, error, broadcast["id"], phone))
+            # Counted once per recipient, so sent + failed never exceeds total
+            if cursor.rowcount:
+                conn.execute(f"UPDATE broadcasts SET {counter} = {counter} + 1 WHERE id = ?", (broadcast["id"],))
+        with self._lock:
+            self._runs[broadcast["id"]]["processed"] += 1
+
+    def _run(self, broadcast_id: int):
+        # These threads only live for one broadcast, so they use their own connections
+        # (closed when it ends) rather than the thread-local ones the pool keeps open
+        conn = database.connect()
+        worker_conns = []
+        worker_local = threading.local()
+
+        def worker_connection():
+            if not hasattr(worker_local, "conn"):
+                worker_local.conn = database.connect(check_same_thread=False)
+                with self._lock:
+                    worker_conns.append(worker_local.conn)
+            return worker_local.conn
+
+        done, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(broadcast_id, done, lost),
+                                     name=f"broadcast-{broadcast_id}-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            broadcast = dict(conn.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone())
+            self._send_pending(broadcast, conn, worker_connection, lost)
+            if lost.is_set():
+                return
+
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE broadcasts SET status = 'completed', finished_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                    (time.time(), broadcast_id, self.owner)
+                )
+                if cursor.rowcount:
+                    StatsService.increment(conn, "pending_alerts", -1)
+            print(f"Broadcast {broadcast_id} completed: {self.progress(broadcast_id, conn)}")
+        finally:
+            # Without heartbeats the claim goes stale, so a failed run is resumed by the sweep
+            done.set()
+            heartbeat.join()
+            with self._lock:
+                self._runs.pop(broadcast_id, None)
+            for worker_conn in worker_conns:
+                worker_conn.close()
+            conn.close()
+
+    def _send_pending(self, broadcast: dict, conn, worker_connection, lost: threading.Event):
+        interval = 1.0 / broadcast["max_rate"]
+        # Bounds queued-but-unsent work so we never hold the whole recipient list in memory
+        slots = threading.BoundedSemaphore(broadcast["concurrency"] * 2)
+        next_send = time.monotonic()
+        last_phone = ""
+
+        def release(_):
+            slots.release()
+
+        with ThreadPoolExecutor(max_workers=broadcast["concurrency"], thread_name_prefix=f"broadcast-{broadcast['id']}") as pool:
+            while True:
+                phones = [row["phone"] for row in conn.execute('''
+                    SELECT phone FROM broadcast_recipients
+                    WHERE broadcast_id = ? AND status = 'pending' AND phone > ?
+                    ORDER BY phone LIMIT 500
+                ''', (broadcast["id"], last_phone))]
+                if not phones or lost.is_set():
+                    break
+                last_phone = phones[-1]
+
+                for phone in phones:
+                    if lost.is_set():
+                        break
+                    # Pace submissions to max_rate messages/sec
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_send = max(next_send, time.monotonic()) + interval
+
+                    slots.acquire()
+                    pool.submit(self._send, broadcast, phone, worker_connection).add_done_callback(release)
+
+    def progress(self, broadcast_id: int, conn=None) -> Optional[dict]:
+        row = (conn or database.get_connection()).execute('''
+            SELECT id, channel, location, community, status, total, sent, failed,
+                   concurrency, max_rate, created_at, started_at, finished_at
+            FROM broadcasts WHERE id = ?
+        ''', (broadcast_id,)).fetchone()
+        if not row:
+            return None
+
+        progress = dict(row)
+        processed = progress["sent"] + progress["failed"]
+        progress["pending"] = progress["total"] - processed
+
+        if progress["started_at"]:
+            elapsed = (progress["finished_at"] or time.time()) - progress["started_at"]
+            progress["messages_per_sec"] = round(processed / elapsed, 2) if elapsed > 0 else 0.0
+        with self._lock:
+            run = self._runs.get(broadcast_id)
+            if run and progress["status"] == "running":
+                # Rate for the current (possibly resumed) run, excluding any downtime
+                elapsed = time.monotonic() - run["started"]
+                progress["current_messages_per_sec"] = round(run["processed"] / elapsed, 2) if elapsed > 0 else 0.0
+        return progress
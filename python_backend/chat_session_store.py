@@ -0,0 +1,124 @@
+import json
+import os
+import secrets
+import time
+from typing import Callable, List, Optional
+
+import database
+
+SUMMARY_PREFIX = "Summary of our earlier conversation: "
+SUMMARY_ACK = "Understood, I'll keep that in mind."
+
+
+def estimate_tokens(history: List[dict]) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return sum(len(part) for turn in history for part in turn["parts"]) // 4
+
+
+def compact_turn(role: str, text: str) -> dict:
+    return {"role": role, "parts": [text]}
+
+
+class ChatSessionStore:
+    """
+    Server-side chat history in the shared `chat_sessions` table, so each /ai/chat
+    call only carries the new message and any uvicorn worker can continue a session.
+
+    History is stored as text-only turns. When it grows past `token_budget` the
+    oldest turns are folded into a summary pair at the start of the history,
+    using `summarizer` (history -> text) if given, or truncated otherwise. Recent
+    turns too long to fit even then (one huge message) have their text cut short.
+    Sessions idle for longer than `idle_ttl` seconds are deleted.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, idle_ttl: Optional[float] = None,
+                 summarizer: Optional[Callable[[List[dict]], Optional[str]]] = None):
+        self.token_budget = token_budget or int(os.getenv("CHAT_SESSION_TOKEN_BUDGET", "2000"))
+        self.idle_ttl = idle_ttl or float(os.getenv("CHAT_SESSION_IDLE_TTL", "1800"))
+        self.summarizer = summarizer
+
+    def _save(self, session_id: str, history: List[dict]):
+        with database.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (id, history, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(history), time.time())
+            )
+
+    def evict_idle(self) -> int:
+        with database.transaction() as conn:
+            return conn.execute(
+                "DELETE FROM chat_sessions WHERE updated_at < ?", (time.time() - self.idle_ttl,)
+            ).rowcount
+
+    def create(self, history: Optional[List[dict]] = None) -> str:
+        self.evict_idle()
+        session_id = secrets.token_urlsafe(16)
+        turns = []
+        for turn in history or []:
+            parts = turn.get("parts", [])
+            if isinstance(parts, str):
+                parts = [parts]
+            text = " ".join(p if isinstance(p, str) else p.get("text", "") for p in parts)
+            turns.append(compact_turn(turn.get("role", "user"), text))
+        self._save(session_id, self._compact(turns))
+        return session_id
+
+    def get_history(self, session_id: str) -> Optional[List[dict]]:
+        row = database.get_connection().execute(
+            "SELECT history, updated_at FROM chat_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if not row or time.time() - row["updated_at"] > self.idle_ttl:
+            return None
+        return json.loads(row["history"])
+
+    def append_turn(self, session_id: str, message: str, reply: str):
+        history = self.get_history(session_id) or []
+        history.append(compact_turn("user", message))
+        history.append(compact_turn("model", reply))
+        self._save(session_id, self._compact(history))
+
+    def _compact(self, history: List[dict]) -> List[dict]:
+        if estimate_tokens(history) <= self.token_budget:
+            return history
+
+        previous_summary = ""
+        if history and history[0]["parts"][0].startswith(SUMMARY_PREFIX):
+            previous_summary = history[0]["parts"][0][len(SUMMARY_PREFIX):]
+            history = history[2:]
+
+        # Keep the newest turns within half the budget, cutting only where a user turn
+        # starts (a failed reply can leave a user turn without its model reply)
+        starts = [i for i, turn in enumerate(history) if turn["role"] == "user"] or [0]
+        cut = next((i for i in starts if estimate_tokens(history[i:]) <= self.token_budget // 2), starts[-1])
+        old, recent = history[:cut], history[cut:]
+
+        to_summarize = ([compact_turn("user", previous_summary)] if previous_summary else []) + old
+        if not to_summarize:
+            # Only the latest exchange is left and it alone is over budget
+            return self._truncate(recent, self.token_budget)
+
+        summary = None
+        if self.summarizer:
+            try:
+                summary = self.summarizer(to_summarize)
+            except Exception as e:
+                print(f"Chat summarization failed, truncating instead: {e}")
+        if not summary:
+            text = " ".join(f"{turn['role']}: {turn['parts'][0]}" for turn in to_summarize)
+            summary = text[-(self.token_budget // 2) * 4:]
+
+        summary_pair = [compact_turn("user", SUMMARY_PREFIX + summary), compact_turn("model", SUMMARY_ACK)]
+        return summary_pair + self._truncate(recent, self.token_budget - estimate_tokens(summary_pair))
+
+    @staticmethod
+    def _truncate(history: List[dict], token_budget: int) -> List[dict]:
+        """Caps the longest turns' text at one length so `history` fits in `token_budget`."""
+        texts = [turn["parts"][0] for turn in history]
+        remaining = max(token_budget, 0) * 4
+        lengths = sorted(len(text) for text in texts)
+        for i, length in enumerate(lengths):
+            if length * (len(lengths) - i) > remaining:
+                cap = remaining // (len(lengths) - i)
+                return [compact_turn(turn["role"], text[:cap]) for turn, text in zip(history, texts)]
+            remaining -= length
+        return history
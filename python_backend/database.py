@@ -0,0 +1,311 @@
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+# --- Database Setup (SQLite) ---
+DB_NAME = os.getenv("DB_NAME", "agrisphere.db")
+
+# Tunables for the long-lived connections (see https://www.sqlite.org/pragma.html)
+SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable enough under WAL
+CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# sqlite3 keeps compiled statements per connection keyed by SQL text, so with
+# long-lived connections every endpoint's query is prepared only once per thread.
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+_connections = set()
+_holders = weakref.WeakSet()
+_connections_lock = threading.Lock()
+
+
+class _ThreadConnection:
+    """Holds one thread's connection; closes it when the thread exits and its locals are freed."""
+
+    def __init__(self):
+        # Only the owning thread uses it, but the finalizer may run on another thread
+        self.conn = connect(check_same_thread=False)
+        self.close = weakref.finalize(self, _release, self.conn)
+        with _connections_lock:
+            _connections.add(self.conn)
+            _holders.add(self)
+
+
+def _release(conn: sqlite3.Connection):
+    with _connections_lock:
+        _connections.discard(conn)
+    conn.close()
+
+
+def connect(path: str = None, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Opens a new connection with WAL journaling and the tuned pragmas applied."""
+    conn = sqlite3.connect(
+        path or DB_NAME,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=check_same_thread,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Returns the calling thread's connection, opening it on first use.
+
+    FastAPI runs sync endpoints on a pool of worker threads, so this acts as a
+    connection pool sized to that thread pool. The pool retires idle threads and
+    starts new ones, so each connection is closed when its thread exits.
+    """
+    holder = getattr(_local, "holder", None)
+    if holder is None or not holder.close.alive:
+        holder = _ThreadConnection()
+        _local.holder = holder
+    return holder.conn
+
+
+def open_connections() -> int:
+    with _connections_lock:
+        return len(_connections)
+
+
+@contextmanager
+def transaction():
+    """Yields the thread's connection; commits on success, rolls back on error."""
+    conn = get_connection()
+    with conn:
+        yield conn
+
+
+def close_all():
+    with _connections_lock:
+        holders = list(_holders)
+    for holder in holders:
+        holder.close()
+    _local.__dict__.clear()
+
+
+# Versioned schema migrations, applied in order and tracked in PRAGMA user_version.
+# Never edit a shipped migration; append a new one instead.
+MIGRATIONS = [
+    (1, "initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT UNIQUE NOT NULL,
+            location TEXT NOT NULL,
+            role TEXT DEFAULT 'farmer',
+            community TEXT,
+            land_area REAL,
+            soil_type TEXT,
+            member_since TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT UNIQUE NOT NULL,
+            role TEXT DEFAULT 'admin'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS growth_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_phone TEXT NOT NULL,
+            crop_name TEXT NOT NULL,
+            sowing_date TEXT NOT NULL,
+            current_stage TEXT,
+            expected_harvest_date TEXT,
+            status TEXT DEFAULT 'Active'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS soil_memory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_phone TEXT NOT NULL,
+            test_date TEXT NOT NULL,
+            ph_level REAL,
+            nitrogen REAL,
+            phosphorus REAL,
+            potassium REAL,
+            moisture REAL,
+            notes TEXT
+        )
+        ''',
+    ]),
+    (2, "indexes for per-farmer history and district lookups", [
+        "CREATE INDEX IF NOT EXISTS idx_growth_records_phone_sowing ON growth_records (user_phone, sowing_date)",
+        "CREATE INDEX IF NOT EXISTS idx_soil_memory_phone_test ON soil_memory (user_phone, test_date)",
+        "CREATE INDEX IF NOT EXISTS idx_users_location ON users (location)",
+    ]),
+    (3, "index for filtering farmers by community", [
+        "CREATE INDEX IF NOT EXISTS idx_users_community ON users (community)",
+    ]),
+    (4, "materialized dashboard stats", [
+        '''
+        CREATE TABLE IF NOT EXISTS district_stats (
+            location TEXT PRIMARY KEY,
+            farmers INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT OR REPLACE INTO district_stats (location, farmers) SELECT location, COUNT(*) FROM users GROUP BY location",
+        '''
+        CREATE TABLE IF NOT EXISTS stat_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+    ]),
+    (5, "outbound SMS queue", [
+        '''
+        CREATE TABLE IF NOT EXISTS sms_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            to_number TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL,
+            last_error TEXT,
+            provider_sid TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_sms_outbox_due ON sms_outbox (status, next_attempt_at)",
+        "CREATE INDEX IF NOT EXISTS idx_sms_outbox_destination ON sms_outbox (to_number, sent_at)",
+    ]),
+    (6, "farmer alert broadcasts", [
+        '''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            message TEXT NOT NULL,
+            location TEXT,
+            community TEXT,
+            concurrency INTEGER NOT NULL,
+            max_rate REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INTEGER NOT NULL,
+            phone TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            PRIMARY KEY (broadcast_id, phone)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)",
+    ]),
+    (7, "shared OTP store", [
+        '''
+        CREATE TABLE IF NOT EXISTS otp_codes (
+            phone TEXT PRIMARY KEY,
+            hashed_otp TEXT NOT NULL,
+            expiry REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_otp_codes_expiry ON otp_codes (expiry)",
+    ]),
+    (8, "server-side chat sessions", [
+        '''
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            id TEXT PRIMARY KEY,
+            history TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated ON chat_sessions (updated_at)",
+    ]),
+    (9, "lease on SMS messages being sent", [
+        "ALTER TABLE sms_outbox ADD COLUMN claimed_at REAL",
+        "CREATE INDEX IF NOT EXISTS idx_sms_outbox_destination_status ON sms_outbox (to_number, status)",
+    ]),
+    (10, "owner and heartbeat of running broadcasts", [
+        "ALTER TABLE broadcasts ADD COLUMN owner TEXT",
+        "ALTER TABLE broadcasts ADD COLUMN heartbeat REAL",
+    ]),
+    (11, "shared rate limit buckets", [
+        '''
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated ON rate_limit_buckets (updated_at)",
+    ]),
+    (12, "crop model registrations shared by all workers", [
+        '''
+        CREATE TABLE IF NOT EXISTS model_registrations (
+            name TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            version TEXT,
+            updated_at REAL NOT NULL
+        )
+        ''',
+    ]),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection = None):
+    """Applies every migration newer than the database's user_version, one transaction each."""
+    conn = conn or get_connection()
+    for version, description, statements in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        # IMMEDIATE takes the write lock up front so parallel workers migrate one at a time
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {version}: {description}")
+
+
+def init_db():
+    migrate()
+
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        # Seed default admin if not exists
+        cursor.execute("SELECT * FROM admins WHERE phone = '9988776655'")
+        if not cursor.fetchone():
+            cursor.execute("INSERT INTO admins (name, phone) VALUES ('Super Admin', '9988776655')")
+            print("Seeded default admin: 9988776655")
+
+        # Seed requested admin
+        cursor.execute("SELECT * FROM admins WHERE phone = '7358372007'")
+        if not cursor.fetchone():
+            cursor.execute("INSERT INTO admins (name, phone) VALUES ('Admin', '7358372007')")
+            print("Seeded admin: 7358372007")
@@ -1,63 +1,187 @@
-
+import asyncio
 import os
-import google.generativeai as genai
-from typing import Optional, List
+import threading
+from typing import AsyncIterator, Optional, List
 from dotenv import load_dotenv
 
+from response_cache import ResponseCache, cache_key, normalize_history, normalize_prompt, perceptual_hash
+
 load_dotenv()
 
+# Context prompt to ensure it behaves like AgriPal
+SYSTEM_INSTRUCTION = "You are AgriPal, a helpful and friendly AI farming assistant. Keep answers concise, practical, and easy for farmers to understand. Use emojis occasionally."
+
+CHAT_ERROR_MESSAGE = "Sorry, I'm having trouble thinking right now. Please try again later."
+CHAT_OFFLINE_MESSAGE = "I am currently offline. Please check my configuration."
+
+class ChatUnavailable(Exception):
+    """Gemini couldn't answer; str(e) is the message to show instead. Nothing should be stored."""
+
 class GeminiService:
-    def __init__(self):
+    def __init__(self, model=None, vision_model=None, cache: Optional[ResponseCache] = None):
         self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
+        # Models can be injected (e.g. stubs in local runs); otherwise they need the API key
+        # and are created on first use, since the SDK takes seconds to import
+        self._model = model
+        self._vision_model = vision_model
+        self._configured = model is not None
+        self._configure_lock = threading.Lock()
+        if self._model is None and not self.api_key:
             print("WARNING: GEMINI_API_KEY not found in environment variables.")
-        else:
-            genai.configure(api_key=self.api_key)
-            # Use the faster, cheaper Flash model for chat
-            self.model = genai.GenerativeModel('gemini-flash-latest')
-            self.vision_model = genai.GenerativeModel('gemini-flash-latest') # Flash supports multi-modal
+
+        # Farmers ask the same questions over and over, so answers are cached on the
+        # normalized prompt. GEMINI_CACHE_DISABLED=1 turns this off.
+        self.cache = cache
+        if self.cache is None and os.getenv("GEMINI_CACHE_DISABLED") != "1":
+            self.cache = ResponseCache()
+
+        # Caps concurrent streaming calls so a burst of chats can't exhaust the upstream quota
+        self.max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+        self._upstream_slots = asyncio.Semaphore(self.max_concurrency)
+
+    def _ensure_models(self):
+        with self._configure_lock:
+            if self._configured:
+                return
+            self._configured = True
+            if self.api_key:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                # Use the faster, cheaper Flash model for chat
+                self._model = genai.GenerativeModel('gemini-flash-latest')
+                self._vision_model = genai.GenerativeModel('gemini-flash-latest') # Flash supports multi-modal
+
+    @property
+    def model(self):
+        self._ensure_models()
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
+        self._configured = True
+
+    @property
+    def vision_model(self):
+        self._ensure_models()
+        return self._vision_model
+
+    @vision_model.setter
+    def vision_model(self, value):
+        self._vision_model = value
+        self._configured = True
+
+    @staticmethod
+    def _build_prompt(message: str, history: List[dict]) -> str:
+        # We can't easily inject system instruction in `start_chat` history without a 'system' role which isn't fully standard in the python client yet for all models in this way,
+        # so we prepend it to the message or rely on the model's general capabilities.
+        # Better approach: Prepend to the first message or send as a user message that establishes context if history is empty.
+        if not history:
+            return f"{SYSTEM_INSTRUCTION}\n\nUser Question: {message}"
+        return message
 
     def generate_chat_response(self, message: str, history: List[dict] = []) -> str:
         """
         Generates a response from Gemini based on user message and simplified history.
         History format expected: [{'role': 'user', 'parts': ['msg']}, {'role': 'model', 'parts': ['msg']}]
+        Raises ChatUnavailable when Gemini is not configured or the call fails.
         """
-        if not self.api_key:
-            return "I am currently offline. Please check my configuration."
+        if self.model is None:
+            raise ChatUnavailable(CHAT_OFFLINE_MESSAGE)
+
+        key = cache_key("chat", normalize_history(history), normalize_prompt(message))
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
 
         try:
-            # Transform history to Gemini format if needed, but the list of dicts 
+            # Transform history to Gemini format if needed, but the list of dicts
             # with 'role' and 'parts' is exactly what start_chat expects.
             chat = self.model.start_chat(history=history)
-            
-            # Context prompt to ensure it behaves like AgriPal
-            system_instruction = "You are AgriPal, a helpful and friendly AI farming assistant. Keep answers concise, practical, and easy for farmers to understand. Use emojis occasionally."
-            
-            # We can't easily inject system instruction in `start_chat` history without a 'system' role which isn't fully standard in the python client yet for all models in this way,
-            # so we prepend it to the message or rely on the model's general capabilities. 
-            # Better approach: Prepend to the first message or send as a user message that establishes context if history is empty.
-            
-            full_prompt = message
-            if not history:
-                 full_prompt = f"{system_instruction}\n\nUser Question: {message}"
-
-            response = chat.send_message(full_prompt)
-            return response.text
+            response = chat.send_message(self._build_prompt(message, history))
+            text = response.text
         except Exception as e:
             print(f"Gemini Chat Error: {e}")
-            return "Sorry, I'm having trouble thinking right now. Please try again later."
+            raise ChatUnavailable(CHAT_ERROR_MESSAGE) from e
+
+        if self.cache:
+            self.cache.set(key, text)
+        return text
+
+    async def stream_chat_response(self, message: str, history: List[dict] = []) -> AsyncIterator[str]:
+        """
+        Async variant of generate_chat_response that yields text chunks as Gemini
+        produces them. Closing the generator (e.g. the client disconnected) releases
+        the upstream slot and abandons the upstream stream. Raises ChatUnavailable,
+        possibly after some chunks were already yielded, when the answer fails.
+        """
+        if not self._configured:
+            # The first use imports the Gemini SDK (seconds); keep that off the event loop
+            await asyncio.to_thread(self._ensure_models)
+        if self.model is None:
+            raise ChatUnavailable(CHAT_OFFLINE_MESSAGE)
 
-    def analyze_image(self, image_data, prompt: str = "Analyze this image related to agriculture") -> str:
+        key = cache_key("chat", normalize_history(history), normalize_prompt(message))
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
+        async with self._upstream_slots:
+            try:
+                chat = self.model.start_chat(history=history)
+                response = await chat.send_message_async(self._build_prompt(message, history), stream=True)
+                async for chunk in response:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+            except Exception as e:
+                print(f"Gemini Chat Stream Error: {e}")
+                raise ChatUnavailable(CHAT_ERROR_MESSAGE) from e
+
+        if self.cache:
+            self.cache.set(key, "".join(chunks))
+
+    def summarize_history(self, history: List[dict]) -> Optional[str]:
+        """Condenses older chat turns into a short summary for server-side sessions."""
+        if self.model is None:
+            return None
+        transcript = "\n".join(f"{turn['role']}: {' '.join(turn['parts'])}" for turn in history)
+        response = self.model.generate_content(
+            "Summarize this conversation between a farmer and AgriPal in under 120 words, "
+            "keeping crops, locations, symptoms and advice already given:\n\n" + transcript
+        )
+        return response.text
+
+    def analyze_image(self, image_data, prompt: str = "Analyze this image related to agriculture",
+                      image_hash: Optional[str] = None) -> str:
         """
-        Analyzes an image provided as PIL Image or bytes.
+        Analyzes an image provided as PIL Image, bytes or a {'mime_type', 'data'} blob.
+        Pass `image_hash` (see response_cache.perceptual_hash) to cache non-PIL inputs.
         """
-        if not self.api_key:
+        if self.vision_model is None:
             return "I am unable to see images right now."
 
+        # Raw bytes can't be hashed perceptually, so they are cached only with a given hash
+        key = None
+        if image_hash is None and hasattr(image_data, "convert"):
+            image_hash = perceptual_hash(image_data)
+        if self.cache and image_hash:
+            key = cache_key("vision", normalize_prompt(prompt), image_hash)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
         try:
-            # Gemini Python SDK supports PIL images directly
+            # Gemini Python SDK supports PIL images and blobs directly
             response = self.vision_model.generate_content([prompt, image_data])
-            return response.text
+            text = response.text
         except Exception as e:
             print(f"Gemini Vision Error: {e}")
             return "I couldn't analyze that image. Please ensure it's a clear photo."
+
+        if key:
+            self.cache.set(key, text)
+        return text
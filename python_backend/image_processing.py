@@ -0,0 +1,164 @@
+import io
+import os
+from PIL import Image, ImageOps
+from response_cache import perceptual_hash
+
+MODEL_INPUT_SIZE = 224
+
+# Transforms (built on first use so importing this module doesn't pull in torch)
+_transform = None
+
+def get_transform():
+    global _transform
+    if _transform is None:
+        import torchvision.transforms as transforms
+        _transform = transforms.Compose([
+            transforms.Resize((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)),
+            transforms.ToTensor()
+        ])
+    return _transform
+
+# How /predict turns an upload into a model input (every mode applies the EXIF orientation):
+#   pil     decode at full size, then Resize + ToTensor (reference pipeline)
+#   draft   let libjpeg decode JPEGs at 1/2-1/8 scale, then a reducing resize
+#   tensor  torchvision.io.decode_jpeg into a uint8 tensor, resized as a tensor
+# The fast modes match `pil` within a small tolerance (see benchmarks/bench_preprocess.py)
+PREPROCESS_MODE = os.getenv("PREPROCESS_MODE", "draft")
+PREPROCESS_MODES = ["pil", "draft", "tensor"]
+
+# Vision uploads: phone photos are often 12MP / 5+ MB, far more than Gemini needs
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1024"))
+VISION_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+VISION_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "85"))
+MAX_UPLOAD_PIXELS = int(os.getenv("MAX_UPLOAD_PIXELS", str(50_000_000)))
+
+ORIENTATION_TAG = 0x0112
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+class InvalidImage(ValueError):
+    pass
+
+class DecodedUpload:
+    """An upload decoded once to an upright RGB image, shared by /predict and Gemini calls."""
+
+    def __init__(self, contents: bytes, image: Image.Image, source_format: str, exif_rotated: bool):
+        self.contents = contents
+        self.image = image
+        self.source_format = source_format
+        self.exif_rotated = exif_rotated
+
+class VisionUpload:
+    """Re-encoded image ready for Gemini plus the byte accounting for it."""
+
+    def __init__(self, payload: dict, image_hash: str, original_bytes: int):
+        self.payload = payload
+        self.image_hash = image_hash
+        self.original_bytes = original_bytes
+        self.sent_bytes = len(payload["data"])
+
+    def stats(self) -> dict:
+        return {
+            "original_bytes": self.original_bytes,
+            "sent_bytes": self.sent_bytes,
+            "bytes_saved": self.original_bytes - self.sent_bytes,
+        }
+
+def find_images(folder: str, class_names):
+    """(path, label index or None) for every image under `folder`, labelled by its parent directory."""
+    items = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        label = os.path.basename(root)
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                items.append((os.path.join(root, name), class_names.index(label) if label in class_names else None))
+    return items
+
+def open_image(contents: bytes) -> Image.Image:
+    """Decodes uploaded bytes into a fully loaded PIL image."""
+    image = Image.open(io.BytesIO(contents))
+    image.load()
+    return image
+
+def resize_reducing(image: Image.Image) -> Image.Image:
+    """Bilinear resize to the model input, box-reducing large images by an integer factor first."""
+    return image.resize((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), Image.BILINEAR, reducing_gap=2.0)
+
+def pil_to_tensor(image: Image.Image):
+    from torchvision.transforms.functional import to_tensor
+    return to_tensor(image)
+
+def preprocess_jpeg_tensor(contents: bytes):
+    import torch
+    from torchvision.io import ImageReadMode, decode_jpeg
+    from torchvision.transforms.functional import resize
+
+    data = torch.frombuffer(bytearray(contents), dtype=torch.uint8)
+    image = decode_jpeg(data, mode=ImageReadMode.RGB, apply_exif_orientation=True)
+    image = resize(image, [MODEL_INPUT_SIZE, MODEL_INPUT_SIZE], antialias=True)
+    return image.float().div_(255)
+
+def preprocess_image(contents: bytes, mode: str = None):
+    """
+    Decodes uploaded bytes into the (3, 224, 224) tensor the crop disease model
+    expects, through the same decode_upload -> preprocess_decoded path as /diagnose.
+    """
+    mode = mode or PREPROCESS_MODE
+    if mode == "tensor" and contents[:2] == b"\xff\xd8":
+        return preprocess_jpeg_tensor(contents)
+
+    upload = decode_upload(contents, draft=mode == "draft")
+    return preprocess_decoded(upload, mode)
+
+def decode_upload(contents: bytes, draft: bool = False) -> DecodedUpload:
+    """
+    Validates and decodes an upload, applying its EXIF orientation. draft=True
+    lets libjpeg decode JPEGs at the largest DCT scaling that stays >= 224px, for
+    callers that only need the model input.
+    """
+    try:
+        image = Image.open(io.BytesIO(contents))
+        source_format = image.format
+        if image.width * image.height > MAX_UPLOAD_PIXELS:
+            raise InvalidImage(f"Image is too large ({image.width}x{image.height})")
+        if draft:
+            # No-op for formats other than JPEG
+            image.draft("RGB", (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+        image.load()
+        exif_rotated = image.getexif().get(ORIENTATION_TAG, 1) != 1
+    except InvalidImage:
+        raise
+    except Exception as e:
+        raise InvalidImage(f"Could not decode image: {e}")
+
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    return DecodedUpload(contents, image, source_format, exif_rotated)
+
+def prepare_vision_upload(upload: DecodedUpload) -> VisionUpload:
+    """Downsizes to VISION_MAX_SIDE and re-encodes at VISION_QUALITY for the Gemini call."""
+    image = upload.image
+    resized = max(image.size) > VISION_MAX_SIDE
+    if resized:
+        image = image.copy()
+        image.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=VISION_FORMAT, quality=VISION_QUALITY, optimize=True)
+    payload = {"mime_type": MIME_TYPES[VISION_FORMAT], "data": buffer.getvalue()}
+
+    # A small photo that already fits can come out bigger after re-encoding; send it as-is
+    # unless it relies on an EXIF rotation the original bytes would still carry
+    if (not resized and not upload.exif_rotated and upload.source_format in MIME_TYPES
+            and len(upload.contents) <= len(payload["data"])):
+        payload = {"mime_type": MIME_TYPES[upload.source_format], "data": upload.contents}
+
+    return VisionUpload(payload, perceptual_hash(image), len(upload.contents))
+
+def preprocess_decoded(upload: DecodedUpload, mode: str = None):
+    """The model input tensor for an already decoded upload, so the bytes are decoded once."""
+    if (mode or PREPROCESS_MODE) == "pil":
+        return get_transform()(upload.image)
+    return pil_to_tensor(resize_reducing(upload.image))
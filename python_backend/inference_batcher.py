@@ -0,0 +1,105 @@
+import asyncio
+import os
+from collections import deque
+from typing import Any, Callable, List, Optional
+
+
+class InferenceBatcher:
+    """
+    Collects concurrent inference requests into a single batch.
+
+    Callers `await submit(item)`; a background task drains the queue until either
+    `max_batch_size` items are waiting or `max_wait_ms` has passed since the first
+    one arrived, then hands the whole list to `process_batch` and resolves each
+    caller's future with its own entry of the returned list.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        executor=None,
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size or int(os.getenv("PREDICT_MAX_BATCH_SIZE", "16"))
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else float(os.getenv("PREDICT_MAX_WAIT_MS", "10"))
+        self.executor = executor
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Occupancy = batch size / max batch size, kept for the most recent batches
+        self.recent_occupancy = deque(maxlen=1000)
+        self.total_batches = 0
+        self.total_items = 0
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Skip requests whose client already went away
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            self.total_batches += 1
+            self.total_items += len(batch)
+            self.recent_occupancy.append(len(batch) / self.max_batch_size)
+
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.process_batch, [item for item, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        recent = list(self.recent_occupancy)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "total_batches": self.total_batches,
+            "total_requests": self.total_items,
+            "avg_batch_size": round(self.total_items / self.total_batches, 2) if self.total_batches else 0.0,
+            "avg_occupancy": round(sum(recent) / len(recent), 3) if recent else 0.0,
+            "last_occupancy": round(recent[-1], 3) if recent else 0.0,
+        }
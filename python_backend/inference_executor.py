@@ -0,0 +1,74 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+import torch_threads
+
+
+class ExecutorSaturated(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Inference executor is saturated")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Keeps CPU-bound image work off the asyncio event loop.
+
+    `pool` runs decode/preprocessing and is either a thread pool or, for multi-core
+    boxes, a process pool (functions passed to `run` must then be picklable).
+    Model forwards always go through `model_pool` because the weights live in this
+    process; torch releases the GIL during a forward, so threads are enough there.
+    """
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        retry_after: Optional[int] = None,
+    ):
+        self.mode = mode or os.getenv("INFERENCE_EXECUTOR_MODE", "thread")
+        self.max_workers = max_workers or int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_queue = max_queue or int(os.getenv("INFERENCE_MAX_QUEUE", "64"))
+        self.retry_after = retry_after or int(os.getenv("INFERENCE_RETRY_AFTER", "2"))
+
+        if self.mode == "process":
+            # One torch thread per preprocessing process, so they don't compete with the model thread
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=torch_threads.single_threaded)
+        elif self.mode == "thread":
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        else:
+            raise ValueError(f"Unknown INFERENCE_EXECUTOR_MODE: {self.mode}")
+
+        self.model_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference-model")
+        # Only touched from the event loop thread, so no lock is needed
+        self.in_flight = 0
+
+    @contextmanager
+    def admit(self):
+        """Reserves a queue slot for one request, or raises ExecutorSaturated when full."""
+        if self.in_flight >= self.max_queue:
+            raise ExecutorSaturated(self.retry_after)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.model_pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+        }
@@ -1,19 +1,51 @@
+import csv
 import io
-import sqlite3
-from pydantic import BaseModel
+import json
+import math
+import time
+from pydantic import BaseModel, Field
 from typing import Optional
-import torch
-import torch.nn as nn
-import torchvision.models as models
-import torchvision.transforms as transforms
-from PIL import Image
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from contextlib import aclosing
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
 import os
 
+import database
+from database import init_db
+from image_processing import InvalidImage, decode_upload, prepare_vision_upload, preprocess_decoded, preprocess_image
+from inference_batcher import InferenceBatcher
+from inference_executor import ExecutorSaturated, InferenceExecutor
+from metrics import LatencyStats
+from model_registry import ModelRegistry
+import torch_threads
+from rate_limiter import RateLimitMiddleware, SQLiteTokenBucketLimiter, TokenBucketLimiter
+
 app = FastAPI()
 
+# Rate limits are kept in the shared database so they hold across all workers;
+# RATE_LIMIT_STORE=memory keeps them per process (each worker then allows the full budget).
+def shared_limiter(name: str, capacity: float, refill_per_sec: float):
+    if os.getenv("RATE_LIMIT_STORE", "sqlite") == "memory":
+        return TokenBucketLimiter(capacity=capacity, refill_per_sec=refill_per_sec)
+    return SQLiteTokenBucketLimiter(name, capacity=capacity, refill_per_sec=refill_per_sec)
+
+# Shed abusive OTP traffic per client IP before it costs SMS spend or CPU.
+# Added before CORS so 429s still carry CORS headers.
+AUTH_RATE_LIMITED_PATHS = ["/auth/send-otp", "/auth/verify-otp"]
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=shared_limiter(
+        "auth_ip",
+        capacity=float(os.getenv("RATE_LIMIT_IP_BURST", "20")),
+        refill_per_sec=float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "20")) / 60
+    ),
+    paths=AUTH_RATE_LIMITED_PATHS,
+    trust_proxy_headers=os.getenv("TRUST_PROXY_HEADERS") == "1"
+)
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -24,80 +56,9 @@ app.add_middleware(
 )
 
 # --- Database Setup (SQLite) ---
-DB_NAME = "agrisphere.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    # Users Table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            phone TEXT UNIQUE NOT NULL,
-            location TEXT NOT NULL,
-            role TEXT DEFAULT 'farmer',
-            community TEXT,
-            land_area REAL,
-            soil_type TEXT,
-            member_since TEXT
-        )
-    ''')
-    
-    # Admins Table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            phone TEXT UNIQUE NOT NULL,
-            role TEXT DEFAULT 'admin'
-        )
-    ''')
-    
-    # Seed default admin if not exists
-    cursor.execute("SELECT * FROM admins WHERE phone = '9988776655'")
-    if not cursor.fetchone():
-        cursor.execute("INSERT INTO admins (name, phone) VALUES ('Super Admin', '9988776655')")
-        print("Seeded default admin: 9988776655")
-
-    # Seed requested admin
-    cursor.execute("SELECT * FROM admins WHERE phone = '7358372007'")
-    if not cursor.fetchone():
-        cursor.execute("INSERT INTO admins (name, phone) VALUES ('Admin', '7358372007')")
-        print("Seeded admin: 7358372007")
-
-    # Growth Records Table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS growth_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_phone TEXT NOT NULL,
-            crop_name TEXT NOT NULL,
-            sowing_date TEXT NOT NULL,
-            current_stage TEXT,
-            expected_harvest_date TEXT,
-            status TEXT DEFAULT 'Active'
-        )
-    ''')
-    
-    # Soil Memory Table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS soil_memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_phone TEXT NOT NULL,
-            test_date TEXT NOT NULL,
-            ph_level REAL,
-            nitrogen REAL,
-            phosphorus REAL,
-            potassium REAL,
-            moisture REAL,
-            notes TEXT
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
-
-init_db()
+@app.on_event("startup")
+def prepare_database():
+    init_db()
 
 # --- Auth Models ---
 class UserSignup(BaseModel):
@@ -130,6 +91,15 @@ class GrowthRecord(BaseModel):
     expected_harvest_date: str
     status: str = "Active"
 
+class BroadcastRequest(BaseModel):
+    message: str
+    channel: str = "sms"
+    location: Optional[str] = None
+    community: Optional[str] = None
+    # Capped further by BROADCAST_MAX_CONCURRENCY / BROADCAST_MAX_RATE
+    concurrency: Optional[int] = Field(default=None, gt=0, le=256)
+    max_rate: Optional[float] = Field(default=None, gt=0, le=10000)
+
 class SoilLog(BaseModel):
     user_phone: str
     ph_level: float
@@ -143,10 +113,16 @@ class SoilLog(BaseModel):
 
 from otp_service import OTPService
 from notification_service import NotificationService
+from broadcast_service import BroadcastService
+from sms_queue import SMSQueue
+from stats_service import StatsService
 
 # Initialize Services
 otp_service = OTPService()
 notification_service = NotificationService()
+sms_queue = SMSQueue(notification_service)
+stats_service = StatsService()
+broadcast_service = BroadcastService(notification_service)
 
 class OTPRequest(BaseModel):
     phone: str
@@ -155,11 +131,33 @@ class OTPVerify(BaseModel):
     phone: str
     otp: str
 
+# Per-phone limits: each send costs an SMS, each verify is a guess at the code.
+otp_send_limiter = shared_limiter(
+    "otp_send",
+    capacity=float(os.getenv("OTP_SEND_BURST", "3")),
+    refill_per_sec=float(os.getenv("OTP_SEND_PER_HOUR", "10")) / 3600
+)
+otp_verify_limiter = shared_limiter(
+    "otp_verify",
+    capacity=float(os.getenv("OTP_VERIFY_BURST", "10")),
+    refill_per_sec=float(os.getenv("OTP_VERIFY_PER_MINUTE", "10")) / 60
+)
+
+def enforce_phone_limit(limiter, phone: str):
+    allowed, retry_after = limiter.allow(phone)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts for this number. Please try again later.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
 @app.post("/auth/send-otp")
 def send_otp(request: OTPRequest):
     # Check if number is valid (simple length check)
     if len(request.phone) != 10 or not request.phone.isdigit():
         raise HTTPException(status_code=400, detail="Invalid phone number format. Use 10 digits.")
+    enforce_phone_limit(otp_send_limiter, request.phone)
 
     # 1. Generate OTP
     otp = otp_service.generate_otp(request.phone)
@@ -172,23 +170,32 @@ def send_otp(request: OTPRequest):
     # But ideally the frontend sends country code. For hackathon, assuming +91.
     target_phone = "91" + request.phone
     
-    success = notification_service.send_sms(target_phone, message)
-    
-    if success:
-        return {"message": "OTP sent via SMS", "debug_otp": otp}
-    else:
-        # Fallback log
-        print(f"FAILED to send SMS. OTP was: {otp}")
-        # We return success=False or 500 in prod, but for hackathon usually helpful to return
-        # the OTP in debug or just say it failed.
-        # But per requirements "Do not include mock data", we return error state if it fails.
-        if os.getenv("TWILIO_ACCOUNT_SID") and os.getenv("TWILIO_ACCOUNT_SID").startswith("SK"):
-            # Provide hint if using API Key as SID
-            print("WARNING: Using API Key SID ('SK...') as Account SID might fail for SMS without explicit AccountContext.")
-        return {"message": "Failed to send SMS (Check server logs)", "debug_otp": otp} # debug_otp kept for dev convenience
+    # Delivery (with retries) happens on the SMS queue workers; poll
+    # /notifications/sms/{message_id} for the delivery status.
+    message_id = sms_queue.enqueue(target_phone, message)
+
+    return {"message": "OTP queued for delivery via SMS", "message_id": message_id, "debug_otp": otp} # debug_otp kept for dev convenience
+
+@app.on_event("startup")
+def start_background_workers():
+    sms_queue.start()
+    otp_service.start_sweeper()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    sms_queue.stop()
+    otp_service.stop_sweeper()
+
+@app.get("/notifications/sms/{message_id}")
+def get_sms_status(message_id: int):
+    status = sms_queue.status(message_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return status
 
 @app.post("/auth/verify-otp")
 def verify_otp(request: OTPVerify):
+    enforce_phone_limit(otp_verify_limiter, request.phone)
     is_valid, message = otp_service.verify_otp(request.phone, request.otp)
     
     if not is_valid:
@@ -200,26 +207,24 @@ def verify_otp(request: OTPVerify):
 # ...
 def signup(user: UserSignup):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        # Check if user exists
-        cursor.execute("SELECT * FROM users WHERE phone = ?", (user.phone,))
-        if cursor.fetchone():
-            conn.close()
-            raise HTTPException(status_code=400, detail="User already exists")
-
-        member_since = "2025-01-01" # Default mock date or use current
-        community = f"{user.location} Farmers"
-        
-        cursor.execute('''
-            INSERT INTO users (name, phone, location, role, community, land_area, soil_type, member_since)
-            VALUES (?, ?, ?, 'farmer', ?, ?, ?, ?)
-        ''', (user.name, user.phone, user.location, community, user.landArea, user.soilType, member_since))
-        
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with database.transaction() as conn:
+            cursor = conn.cursor()
+
+            # Check if user exists
+            cursor.execute("SELECT * FROM users WHERE phone = ?", (user.phone,))
+            if cursor.fetchone():
+                raise HTTPException(status_code=400, detail="User already exists")
+
+            member_since = "2025-01-01" # Default mock date or use current
+            community = f"{user.location} Farmers"
+
+            cursor.execute('''
+                INSERT INTO users (name, phone, location, role, community, land_area, soil_type, member_since)
+                VALUES (?, ?, ?, 'farmer', ?, ?, ?, ?)
+            ''', (user.name, user.phone, user.location, community, user.landArea, user.soilType, member_since))
+
+            user_id = cursor.lastrowid
+            StatsService.record_signup(conn, user.location)
         
         return {
             "id": str(user_id),
@@ -232,16 +237,15 @@ def signup(user: UserSignup):
             "soilType": user.soilType,
             "memberSince": member_since
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/auth/login")
 def login(login_data: UserLogin):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE phone = ?", (login_data.phone,))
-    row = cursor.fetchone()
-    conn.close()
+    conn = database.get_connection()
+    row = conn.execute("SELECT * FROM users WHERE phone = ?", (login_data.phone,)).fetchone()
 
     if not row:
         raise HTTPException(status_code=404, detail="User not found")
@@ -260,9 +264,6 @@ def login(login_data: UserLogin):
 
 @app.put("/auth/update")
 def update_profile(update_data: UserUpdate):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
     # Build query dynamically
     fields = []
     values = []
@@ -280,19 +281,19 @@ def update_profile(update_data: UserUpdate):
         values.append(update_data.soilType)
         
     if not fields:
-        conn.close()
         raise HTTPException(status_code=400, detail="No fields to update")
     
     values.append(update_data.phone)
     query = f"UPDATE users SET {', '.join(fields)} WHERE phone = ?"
     
-    cursor.execute(query, tuple(values))
-    conn.commit()
-    
-    # Fetch updated user
-    cursor.execute("SELECT * FROM users WHERE phone = ?", (update_data.phone,))
-    row = cursor.fetchone()
-    conn.close()
+    with database.transaction() as conn:
+        previous = conn.execute("SELECT location FROM users WHERE phone = ?", (update_data.phone,)).fetchone()
+        conn.execute(query, tuple(values))
+        if previous and update_data.location:
+            StatsService.record_location_change(conn, previous["location"], update_data.location)
+
+        # Fetch updated user
+        row = conn.execute("SELECT * FROM users WHERE phone = ?", (update_data.phone,)).fetchone()
     
     if not row:
         raise HTTPException(status_code=404, detail="User not found")
@@ -313,11 +314,8 @@ def update_profile(update_data: UserUpdate):
 
 @app.post("/admin/auth/login")
 def admin_login(login_data: AdminLogin):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM admins WHERE phone = ?", (login_data.phone,))
-    row = cursor.fetchone()
-    conn.close()
+    conn = database.get_connection()
+    row = conn.execute("SELECT * FROM admins WHERE phone = ?", (login_data.phone,)).fetchone()
 
     if not row:
         raise HTTPException(status_code=401, detail="Unauthorized: Not an admin number")
@@ -331,95 +329,157 @@ def admin_login(login_data: AdminLogin):
 
 @app.get("/admin/dashboard/stats")
 def get_admin_stats():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Real Stats
-    cursor.execute("SELECT COUNT(*) FROM users")
-    total_farmers = cursor.fetchone()[0]
-    
-    # Mock Stats for now (placeholders until we have real tables for these)
-    active_complaints = 45
-    pending_alerts = 12
-    resolved_today = 38
-    
-    # Farmers by District (Real Aggregation)
-    cursor.execute("SELECT location, COUNT(*) FROM users GROUP BY location")
-    district_data = [{"district": row[0], "farmers": row[1]} for row in cursor.fetchall()]
-    
-    conn.close()
-    
-    return {
-        "total_farmers": total_farmers,
-        "active_complaints": active_complaints,
-        "pending_alerts": pending_alerts,
-        "resolved_today": resolved_today,
-        "district_stats": district_data
-    }
+    # Served from the materialized district_stats/stat_counters tables (O(districts)),
+    # cached for up to ADMIN_STATS_MAX_STALENESS seconds
+    return stats_service.get_dashboard_stats()
+
+@app.post("/admin/broadcasts")
+def create_broadcast(request: BroadcastRequest):
+    """Sends an alert to every farmer matching location/community; progress via GET."""
+    try:
+        return broadcast_service.create(
+            request.message,
+            channel=request.channel,
+            location=request.location,
+            community=request.community,
+            concurrency=request.concurrency,
+            max_rate=request.max_rate
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/admin/broadcasts/{broadcast_id}")
+def get_broadcast(broadcast_id: int):
+    progress = broadcast_service.progress(broadcast_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return progress
+
+@app.on_event("startup")
+def resume_broadcasts():
+    # Claims are shared through the database, so every worker can run this
+    broadcast_service.start()
+
+@app.on_event("shutdown")
+def stop_broadcast_sweeper():
+    broadcast_service.stop()
+
+FARMER_COLUMNS = ["id", "name", "phone", "location", "community", "member_since"]
+EXPORT_CHUNK_SIZE = 1000
+
+def farmers_query(after_id: int, location: Optional[str], community: Optional[str]):
+    """Keyset query over users.id so each page is an index range scan, not an OFFSET skip."""
+    conditions = ["id > ?"]
+    params = [after_id]
+    if location:
+        conditions.append("location = ?")
+        params.append(location)
+    if community:
+        conditions.append("community = ?")
+        params.append(community)
+    query = f"SELECT {', '.join(FARMER_COLUMNS)} FROM users WHERE {' AND '.join(conditions)} ORDER BY id"
+    return query, params
+
+def stream_farmers(query: str, params: list, export_format: str):
+    # Starlette may resume this generator on different threadpool threads,
+    # so it gets its own connection instead of the thread-local one.
+    conn = database.connect(check_same_thread=False)
+    try:
+        cursor = conn.execute(query, params)
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(FARMER_COLUMNS)
+            yield buffer.getvalue()
+
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            if export_format == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(dict(row)) + "\n" for row in rows)
+    finally:
+        conn.close()
 
 @app.get("/admin/farmers")
-def get_all_farmers():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, phone, location, community, member_since FROM users")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [dict(row) for row in rows]
+def get_all_farmers(
+    cursor: int = 0,
+    limit: int = 100,
+    location: Optional[str] = None,
+    community: Optional[str] = None,
+    format: str = "json"
+):
+    """
+    Pages through farmers by id. Pass the returned `next_cursor` back as `cursor`
+    for the next page. `format=ndjson|csv` streams every matching row after
+    `cursor` instead (ignoring `limit`) for exports.
+    """
+    if format not in ("json", "ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be one of json, ndjson, csv")
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+
+    query, params = farmers_query(cursor, location, community)
+
+    if format == "csv":
+        return StreamingResponse(
+            stream_farmers(query, params, format),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=farmers.csv"}
+        )
+    if format == "ndjson":
+        return StreamingResponse(stream_farmers(query, params, format), media_type="application/x-ndjson")
+
+    conn = database.get_connection()
+    rows = conn.execute(query + " LIMIT ?", params + [limit]).fetchall()
+
+    farmers = [dict(row) for row in rows]
+    next_cursor = farmers[-1]["id"] if len(farmers) == limit else None
+    return {"farmers": farmers, "next_cursor": next_cursor}
 
 # --- Feature Endpoints ---
 
 @app.post("/farmer/growth")
 def add_growth_record(record: GrowthRecord):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO growth_records (user_phone, crop_name, sowing_date, current_stage, expected_harvest_date, status)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (record.user_phone, record.crop_name, record.sowing_date, record.current_stage, record.expected_harvest_date, record.status))
-    conn.commit()
-    conn.close()
+    with database.transaction() as conn:
+        conn.execute('''
+            INSERT INTO growth_records (user_phone, crop_name, sowing_date, current_stage, expected_harvest_date, status)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (record.user_phone, record.crop_name, record.sowing_date, record.current_stage, record.expected_harvest_date, record.status))
     return {"message": "Growth record added"}
 
 @app.get("/farmer/growth/{phone}")
 def get_growth_records(phone: str):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM growth_records WHERE user_phone = ? ORDER BY sowing_date DESC", (phone,))
-    rows = cursor.fetchall()
-    conn.close()
+    conn = database.get_connection()
+    rows = conn.execute("SELECT * FROM growth_records WHERE user_phone = ? ORDER BY sowing_date DESC", (phone,)).fetchall()
     return [dict(row) for row in rows]
 
 @app.post("/farmer/soil")
 def add_soil_log(log: SoilLog):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
     import datetime
     today = datetime.date.today().isoformat()
-    cursor.execute('''
-        INSERT INTO soil_memory (user_phone, test_date, ph_level, nitrogen, phosphorus, potassium, moisture, notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (log.user_phone, today, log.ph_level, log.nitrogen, log.phosphorus, log.potassium, log.moisture, log.notes))
-    conn.commit()
-    conn.close()
+    with database.transaction() as conn:
+        conn.execute('''
+            INSERT INTO soil_memory (user_phone, test_date, ph_level, nitrogen, phosphorus, potassium, moisture, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (log.user_phone, today, log.ph_level, log.nitrogen, log.phosphorus, log.potassium, log.moisture, log.notes))
     return {"message": "Soil log added"}
 
 @app.get("/farmer/soil/{phone}")
 def get_soil_history(phone: str):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM soil_memory WHERE user_phone = ? ORDER BY test_date ASC", (phone,))
-    rows = cursor.fetchall()
-    conn.close()
+    conn = database.get_connection()
+    rows = conn.execute("SELECT * FROM soil_memory WHERE user_phone = ? ORDER BY test_date ASC", (phone,)).fetchall()
     return [dict(row) for row in rows]
 
 
 
 # --- Crop Disease Model Logic ---
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# eager | torchscript | dynamic_int8 | static_int8 | onnx (exports come from model_export.py)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "eager")
 # specific absolute path to the local model file
 LOCAL_MODEL_PATH = r"C:\Users\TR Sreehari\Desktop\crop_model\crop_disease_model.pth"
 # fallback to current directory
@@ -429,95 +489,282 @@ BUNDLED_MODEL_PATH = os.path.join(BACKEND_DIR, "crop_disease_model.pth")
 # Try specific path first, then bundled
 MODEL_PATH = LOCAL_MODEL_PATH if os.path.exists(LOCAL_MODEL_PATH) else BUNDLED_MODEL_PATH
 
-# Global variables for model
-model = None
-class_names = []
-
-def load_model():
-    global model, class_names
+# Load in the background at startup (MODEL_PRELOAD=1) or on the first /predict (0)
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1") == "1"
+
+# Named checkpoints from the MODEL_REGISTRY manifest, or MODEL_PATH as "default"
+model_registry = ModelRegistry.from_env(MODEL_PATH, MODEL_BACKEND)
+
+# Decode/preprocess and forwards run here instead of on the event loop
+inference_executor = InferenceExecutor()
+
+def start_model_loading():
+    """Starts loading every registered model once; later calls are no-ops."""
+    model_registry.start()
+
+@app.on_event("startup")
+def preload_model():
+    if MODEL_PRELOAD:
+        start_model_loading()
+    model_registry.start_watcher()
+
+@app.on_event("shutdown")
+def shutdown_inference_executor():
+    model_registry.shutdown()
+    inference_executor.shutdown()
+    database.close_all()
+
+def service_unavailable(e: ExecutorSaturated) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy processing images. Please retry shortly.",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def model_loading_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="The crop disease model is still loading. Please retry shortly.",
+        headers={"Retry-After": "5"}
+    )
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the worker is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: the database answers and the model is loaded and warmed up."""
+    checks = {"model": model_registry.state()}
     try:
-        print(f"Loading model from {MODEL_PATH} on {DEVICE}...")
-        checkpoint = torch.load(MODEL_PATH, map_location=DEVICE)
-        
-        # Load class names
-        class_names = checkpoint["class_names"]
-        num_classes = len(class_names)
-        print(f"Classes found: {class_names}")
-
-        # Initialize Model (MobileNetV2 as per sanity.py)
-        model = models.mobilenet_v2(weights=None)
-        # Recreate classifier head
-        model.classifier[1] = nn.Linear(model.last_channel, num_classes)
-        
-        # Load weights
-        model.load_state_dict(checkpoint["model_state"])
-        model.to(DEVICE)
-        model.eval()
-        print("Model loaded successfully!")
+        database.get_connection().execute("SELECT 1").fetchone()
+        checks["database"] = "ok"
     except Exception as e:
-        print(f"Error loading model: {e}")
-        # Placeholder for robustness if model load fails (e.g. dev environment without model file)
-        model = None
-
-# Load model on startup
-load_model()
+        checks["database"] = f"error: {e}"
 
-# Transforms
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor()
-])
+    ready = checks["model"] == "ready" and checks["database"] == "ok"
+    body = {"status": "ready" if ready else "not_ready", "checks": checks,
+            "model_error": model_registry.error()}
+    return JSONResponse(body, status_code=200 if ready else 503)
 
 @app.get("/")
 def home():
     return {"message": "Crop Disease Detection API is running"}
 
+# /predict returns this many classes in `all_scores` unless the caller asks for more
+PREDICT_DEFAULT_TOP_K = int(os.getenv("PREDICT_DEFAULT_TOP_K", "3"))
+
+def predict_with(loaded, items):
+    """
+    Runs one forward pass of `loaded` over (tensor, top_k) items, where each tensor
+    is a preprocessed (3, 224, 224) image and top_k=None asks for every class.
+    """
+    import torch
+
+    class_names = loaded.class_names
+    batch = torch.stack([tensor for tensor, _ in items]).to(loaded.device)
+    k = max(len(class_names) if top_k is None else min(top_k, len(class_names)) for _, top_k in items)
+
+    with torch.no_grad():
+        output = loaded.model(batch)
+        probs = torch.softmax(output, dim=1)
+        # One topk and one device->host copy for the whole batch instead of .item() per score
+        top_probs, top_idxs = probs.topk(k, dim=1)
+        top_probs, top_idxs = top_probs.mul_(100).tolist(), top_idxs.tolist()
+
+    results = []
+    for (_, top_k), scores, idxs in zip(items, top_probs, top_idxs):
+        limit = len(class_names) if top_k is None else top_k
+        all_scores = {class_names[idx]: round(score, 2) for idx, score in zip(idxs[:limit], scores[:limit])}
+        results.append({
+            "class": class_names[idxs[0]],
+            "confidence": round(scores[0], 2),
+            "all_scores": all_scores,
+            "model": loaded.name,
+            "model_version": loaded.version
+        })
+    return results
+
+def run_prediction_batch(items):
+    """
+    Runs a micro-batch of (LoadedModel, tensor, top_k) items with one forward per
+    model version in it. Each item keeps the version it was routed to, even if a
+    newer one was swapped in while it waited.
+    """
+    groups = {}
+    for i, (loaded, tensor, top_k) in enumerate(items):
+        groups.setdefault(id(loaded), (loaded, []))[1].append(i)
+
+    results = [None] * len(items)
+    for loaded, indices in groups.values():
+        outputs = predict_with(loaded, [items[i][1:] for i in indices])
+        for i, result in zip(indices, outputs):
+            results[i] = result
+    return results
+
+def resolve_model(name: Optional[str]):
+    """The current version of the requested model, or None while it is loading."""
+    try:
+        return model_registry.get(name)
+    except KeyError:
+        pass
+    # Possibly registered through another worker since this one last looked
+    if model_registry.sync_registrations():
+        return resolve_model(name)
+    raise HTTPException(status_code=404, detail=f"Unknown model '{name}'")
+
+# Batch size / wait limits come from PREDICT_MAX_BATCH_SIZE and PREDICT_MAX_WAIT_MS
+predict_batcher = InferenceBatcher(run_prediction_batch, executor=inference_executor.model_pool)
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    if model is None:
-        return {"error": "Model not loaded properly"}
+async def predict(
+    file: UploadFile = File(...),
+    top_k: int = Query(PREDICT_DEFAULT_TOP_K, ge=1),
+    full: bool = False,
+    format: str = "json",
+    model: Optional[str] = None
+):
+    """
+    Predicts the crop disease with the registry's `model` (the default model if
+    omitted). `all_scores` holds the `top_k` most likely classes, or every class
+    with full=true. format=msgpack returns the same fields as application/msgpack
+    for the mobile client.
+    """
+    if format not in ("json", "msgpack"):
+        raise HTTPException(status_code=400, detail="format must be json or msgpack")
+    loaded = resolve_model(model)
+    if loaded is None:
+        start_model_loading()
+        if model_registry.state(model) == "failed":
+            return {"error": f"Model not loaded properly: {model_registry.error(model)}"}
+        raise model_loading_unavailable()
 
     try:
-        # Read image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-        
-        # Preprocess
-        tensor_img = transform(image).unsqueeze(0).to(DEVICE)
-        
-        # Inference
-        with torch.no_grad():
-            output = model(tensor_img)
-            probs = torch.softmax(output, dim=1)
-            confidence, pred_idx = probs.max(dim=1)
-            
-            check_confidence = confidence.item()
-            predicted_class = class_names[pred_idx.item()]
-            
-        return {
-            "class": predicted_class,
-            "confidence": round(check_confidence * 100, 2),
-            "all_scores": {name: round(prob.item() * 100, 2) for name, prob in zip(class_names, probs[0])}
-        }
+        with inference_executor.admit():
+            # Read image
+            contents = await file.read()
+
+            # Decode + preprocess
+            tensor_img = await inference_executor.run(preprocess_image, contents)
+
+            # Inference (batched with other concurrent uploads)
+            started = time.perf_counter()
+            result = await predict_batcher.submit((loaded, tensor_img, None if full else top_k))
+            model_registry.record_latency(loaded, (time.perf_counter() - started) * 1000)
 
+    except ExecutorSaturated as e:
+        raise service_unavailable(e)
     except Exception as e:
         return {"error": str(e)}
 
+    if format == "msgpack":
+        import msgpack
+        return Response(content=msgpack.packb(result), media_type="application/msgpack")
+    return result
+
+@app.get("/predict/stats")
+def predict_stats():
+    return {**predict_batcher.stats(), "executor": inference_executor.stats(), "torch": torch_threads.settings}
+
+class ModelReloadRequest(BaseModel):
+    path: Optional[str] = None
+    version: Optional[str] = None
+
+@app.get("/models")
+def list_models():
+    """Registered models, their current versions and per-version latency."""
+    return model_registry.status()
+
+@app.post("/admin/models/{name}/reload", status_code=202)
+def reload_model(name: str, request: Optional[ModelReloadRequest] = None):
+    """
+    Loads a new version of `name` (its current checkpoint, or `path`) in the
+    background and swaps it in once warmed up. A new name registers a new model.
+    The registration is shared, so the other workers load it on their next
+    model watch (MODEL_WATCH_INTERVAL).
+    """
+    request = request or ModelReloadRequest()
+    if request.path and not os.path.exists(request.path):
+        raise HTTPException(status_code=400, detail=f"Checkpoint not found: {request.path}")
+    try:
+        version = model_registry.register(name, request.path, request.version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{name}'; pass a path to register it")
+    return {"name": name, "version": version, "state": "loading"}
+
 # ... (Previous imports)
-from gemini_service import GeminiService
+from chat_session_store import ChatSessionStore
+from gemini_service import ChatUnavailable, GeminiService
 from typing import List, Dict, Any
 
 # ... (Previous initializations)
 gemini_service = GeminiService()
+chat_sessions = ChatSessionStore(summarizer=gemini_service.summarize_history)
 
 class ChatRequest(BaseModel):
     message: str
+    # Send session_id from the previous response instead of the full history;
+    # `history` is only used to seed a new session.
+    session_id: Optional[str] = None
     history: List[Dict[str, Any]] = []
 
+def resolve_chat_session(request: ChatRequest):
+    """Returns (session_id, stored history), creating a session when none was given."""
+    if request.session_id:
+        history = chat_sessions.get_history(request.session_id)
+        if history is None:
+            raise HTTPException(status_code=404, detail="Chat session not found or expired")
+        return request.session_id, history
+
+    session_id = chat_sessions.create(request.history)
+    return session_id, chat_sessions.get_history(session_id)
+
 @app.post("/ai/chat")
 def chat_with_ai(request: ChatRequest):
-    response = gemini_service.generate_chat_response(request.message, request.history)
-    return {"response": response}
+    session_id, history = resolve_chat_session(request)
+    try:
+        response = gemini_service.generate_chat_response(request.message, history)
+    except ChatUnavailable as e:
+        # Shown to the farmer but kept out of the session
+        return {"response": str(e), "session_id": session_id}
+    chat_sessions.append_turn(session_id, request.message, response)
+    return {"response": response, "session_id": session_id}
+
+@app.post("/ai/chat/stream")
+async def chat_with_ai_stream(request: ChatRequest, http_request: Request):
+    """Same as /ai/chat but streams the answer as Server-Sent Events while it is generated."""
+    session_id, history = await run_in_threadpool(resolve_chat_session, request)
+
+    async def events():
+        yield f"event: session\ndata: {json.dumps({'session_id': session_id})}\n\n"
+        reply = []
+        try:
+            async with aclosing(gemini_service.stream_chat_response(request.message, history)) as chunks:
+                async for chunk in chunks:
+                    if await http_request.is_disconnected():
+                        return
+                    reply.append(chunk)
+                    yield f"data: {json.dumps({'text': chunk})}\n\n"
+        except ChatUnavailable as e:
+            # Shown to the farmer, but a failed (possibly partial) answer is kept out of the session
+            yield f"data: {json.dumps({'text': str(e)})}\n\n"
+        else:
+            # May summarize through Gemini, so keep it off the event loop
+            await run_in_threadpool(chat_sessions.append_turn, session_id, request.message, "".join(reply))
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/ai/cache/stats")
+def ai_cache_stats():
+    if not gemini_service.cache:
+        return {"enabled": False}
+    return {"enabled": True, **gemini_service.cache.stats()}
 
 @app.post("/ai/analyze")
 async def analyze_image(file: UploadFile = File(...), prompt: Optional[str] = Form("What is wrong with this crop?")):
@@ -525,13 +772,97 @@ async def analyze_image(file: UploadFile = File(...), prompt: Optional[str] = Fo
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
             
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        response = gemini_service.analyze_image(image, prompt)
-        return {"response": response}
+        with inference_executor.admit():
+            contents = await file.read()
+            upload = await inference_executor.run(decode_upload, contents)
+            vision_upload = await inference_executor.run(prepare_vision_upload, upload)
+
+        # The Gemini call is network-bound, so a regular threadpool worker is enough
+        response = await run_in_threadpool(
+            gemini_service.analyze_image, vision_upload.payload, prompt, vision_upload.image_hash
+        )
+        return {"response": response, "image_bytes": vision_upload.stats()}
+    except ExecutorSaturated as e:
+        raise service_unavailable(e)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- Combined diagnosis: local model first, Gemini only when it is unsure ---
+DIAGNOSIS_ESCALATION_THRESHOLD = float(os.getenv("DIAGNOSIS_ESCALATION_THRESHOLD", "70"))  # top-1 confidence, %
+
+diagnosis_counts = {"requests": 0, "escalations": 0}
+diagnosis_latency = {"local": LatencyStats(), "gemini": LatencyStats(), "total": LatencyStats()}
+
+@app.post("/diagnose")
+async def diagnose(
+    file: UploadFile = File(...),
+    prompt: Optional[str] = Form("What is wrong with this crop?"),
+    threshold: Optional[float] = Form(None),
+    model: Optional[str] = Form(None)
+):
+    """
+    Runs the local crop disease model and only asks Gemini when its top-1
+    confidence is below `threshold` (DIAGNOSIS_ESCALATION_THRESHOLD by default).
+    The upload is decoded once and shared by both tiers.
+    """
+    threshold = DIAGNOSIS_ESCALATION_THRESHOLD if threshold is None else threshold
+    loaded = resolve_model(model)
+    started = time.perf_counter()
+
+    try:
+        with inference_executor.admit():
+            contents = await file.read()
+            upload = await inference_executor.run(decode_upload, contents)
+            diagnosis_counts["requests"] += 1
+
+            local = None
+            if loaded is None:
+                start_model_loading()
+            else:
+                local_started = time.perf_counter()
+                tensor_img = await inference_executor.run(preprocess_decoded, upload)
+                local = await predict_batcher.submit((loaded, tensor_img, PREDICT_DEFAULT_TOP_K))
+                local_ms = (time.perf_counter() - local_started) * 1000
+                diagnosis_latency["local"].record(local_ms)
+                model_registry.record_latency(loaded, local_ms)
+
+                if local["confidence"] >= threshold:
+                    diagnosis_latency["total"].record((time.perf_counter() - started) * 1000)
+                    return {"source": "local", **local}
+
+            vision_upload = await inference_executor.run(prepare_vision_upload, upload)
+    except ExecutorSaturated as e:
+        raise service_unavailable(e)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Escalate: the local model is unsure (or not loaded)
+    diagnosis_counts["escalations"] += 1
+    if local:
+        prompt = f"{prompt}\nA local model suggested '{local['class']}' with {local['confidence']}% confidence."
+
+    gemini_started = time.perf_counter()
+    response = await run_in_threadpool(
+        gemini_service.analyze_image, vision_upload.payload, prompt, vision_upload.image_hash
+    )
+    diagnosis_latency["gemini"].record((time.perf_counter() - gemini_started) * 1000)
+    diagnosis_latency["total"].record((time.perf_counter() - started) * 1000)
+
+    return {"source": "gemini", "response": response, "local": local, "image_bytes": vision_upload.stats()}
+
+@app.get("/diagnose/stats")
+def diagnose_stats():
+    requests = diagnosis_counts["requests"]
+    return {
+        "threshold": DIAGNOSIS_ESCALATION_THRESHOLD,
+        "requests": requests,
+        "escalations": diagnosis_counts["escalations"],
+        "escalation_rate": round(diagnosis_counts["escalations"] / requests, 3) if requests else 0.0,
+        "latency": {tier: stats.summary() for tier, stats in diagnosis_latency.items()},
+    }
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    # WEB_CONCURRENCY workers; each sizes its torch thread pool to its share of the cores
+    uvicorn.run("main:app", host="0.0.0.0", port=8001, workers=torch_threads.web_workers())
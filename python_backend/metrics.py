@@ -0,0 +1,36 @@
+import threading
+from collections import deque
+
+
+class LatencyStats:
+    """Request count plus mean and percentiles over the most recent `window` latencies."""
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.total_ms = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, ms: float):
+        with self._lock:
+            self.count += 1
+            self.total_ms += ms
+            self._recent.append(ms)
+
+    def summary(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total_ms = self.count, self.total_ms
+        if not recent:
+            return {"count": count, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+
+        def percentile(p):
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 2)
+
+        return {
+            "count": count,
+            "mean_ms": round(total_ms / count, 2),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
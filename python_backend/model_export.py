@@ -0,0 +1,162 @@
+"""
+Exports the crop disease checkpoint to the CPU serving backends used with
+MODEL_BACKEND (see model_loader.py) and checks them against the eager model.
+
+  torchscript   frozen, traced float32 graph
+  dynamic_int8  int8 weights for the Linear classifier, quantized on the fly
+  static_int8   fully int8 MobileNetV2 (fused conv/bn/relu), calibrated on --calibration-dir
+  onnx          float32 graph for onnxruntime (pip install onnx onnxruntime)
+
+With --holdout-dir, every exported backend is run over that folder and compared
+with the eager model: top-1 agreement, accuracy when images sit in per-class
+subfolders, and the largest probability difference. Exits non-zero when a
+backend agrees with eager on fewer than --min-agreement percent of images.
+
+Run from python_backend/:
+  python model_export.py --calibration-dir data/calib --holdout-dir data/holdout
+"""
+import argparse
+import json
+import os
+import sys
+
+import torch
+import torch.nn as nn
+from torchvision.models import quantization as quantized_models
+
+from image_processing import find_images, get_transform, open_image
+from model_loader import EXPORT_SUFFIXES, class_names_path, export_path, load_checkpoint, load_serving_model
+
+
+def load_tensor(path: str) -> torch.Tensor:
+    with open(path, "rb") as f:
+        return get_transform()(open_image(f.read()).convert("RGB"))
+
+
+def image_batches(items, batch_size: int):
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        yield torch.stack([load_tensor(path) for path, _ in chunk]), [label for _, label in chunk]
+
+
+def trace(model: nn.Module) -> torch.jit.ScriptModule:
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.randn(1, 3, 224, 224))
+    return torch.jit.freeze(traced.eval())
+
+
+def export_torchscript(model, class_names, args):
+    return trace(model)
+
+
+def export_dynamic_int8(model, class_names, args):
+    # MobileNetV2 is mostly convolutions, which dynamic quantization leaves in float32
+    quantized = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    return trace(quantized)
+
+
+def export_static_int8(model, class_names, args):
+    if not args.calibration_dir:
+        raise ValueError("static_int8 needs --calibration-dir with representative crop photos")
+
+    qmodel = quantized_models.mobilenet_v2(weights=None, quantize=False, num_classes=len(class_names))
+    qmodel.load_state_dict(model.state_dict())
+    qmodel.eval()
+    qmodel.fuse_model()
+    qmodel.qconfig = torch.ao.quantization.get_default_qconfig(torch.backends.quantized.engine)
+    torch.ao.quantization.prepare(qmodel, inplace=True)
+
+    items = find_images(args.calibration_dir, class_names)[:args.calibration_images]
+    with torch.no_grad():
+        for batch, _ in image_batches(items, args.batch_size):
+            qmodel(batch)
+    print(f"  calibrated on {len(items)} images")
+
+    torch.ao.quantization.convert(qmodel, inplace=True)
+    return trace(qmodel)
+
+
+EXPORTERS = {
+    "torchscript": export_torchscript,
+    "dynamic_int8": export_dynamic_int8,
+    "static_int8": export_static_int8,
+}
+
+
+def export(model, class_names, backend: str, args):
+    path = export_path(args.checkpoint, backend)
+    if backend == "onnx":
+        torch.onnx.export(
+            model, (torch.randn(1, 3, 224, 224),), path,
+            input_names=["input"], output_names=["logits"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=17, dynamo=False
+        )
+    else:
+        torch.jit.save(EXPORTERS[backend](model, class_names, args), path)
+    print(f"  wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+def check_parity(eager, class_names, backends, args) -> bool:
+    items = find_images(args.holdout_dir, class_names)
+    if not items:
+        print(f"No images found under {args.holdout_dir}")
+        return False
+
+    results = {"eager": {"preds": [], "probs": []}}
+    served = {backend: load_serving_model(args.checkpoint, backend)[0] for backend in backends}
+    for backend in backends:
+        results[backend] = {"preds": [], "probs": []}
+
+    labels = []
+    with torch.no_grad():
+        for batch, batch_labels in image_batches(items, args.batch_size):
+            labels.extend(batch_labels)
+            for backend, model in [("eager", eager)] + list(served.items()):
+                probs = torch.softmax(model(batch), dim=1)
+                results[backend]["probs"].append(probs)
+                results[backend]["preds"].extend(probs.argmax(dim=1).tolist())
+
+    labelled = [i for i, label in enumerate(labels) if label is not None]
+    eager_probs = torch.cat(results["eager"]["probs"])
+    ok = True
+    print(f"\nParity on {len(items)} images ({len(labelled)} labelled)")
+    print(f"{'backend':<14} {'agreement %':>12} {'accuracy %':>11} {'max |dp|':>9}")
+    for backend, result in results.items():
+        preds = result["preds"]
+        agreement = 100 * sum(p == e for p, e in zip(preds, results["eager"]["preds"])) / len(preds)
+        accuracy = (f"{100 * sum(preds[i] == labels[i] for i in labelled) / len(labelled):.2f}"
+                    if labelled else "-")
+        max_diff = (torch.cat(result["probs"]) - eager_probs).abs().max().item()
+        print(f"{backend:<14} {agreement:>12.2f} {accuracy:>11} {max_diff:>9.4f}")
+        ok = ok and agreement >= args.min_agreement
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--checkpoint", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "crop_disease_model.pth"))
+    parser.add_argument("--backends", nargs="+", default=list(EXPORT_SUFFIXES), choices=list(EXPORT_SUFFIXES))
+    parser.add_argument("--calibration-dir", help="images used to calibrate static_int8 activations")
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--holdout-dir", help="images (optionally in per-class subfolders) for the parity check")
+    parser.add_argument("--min-agreement", type=float, default=98.0, help="minimum top-1 agreement with eager, percent")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--skip-export", action="store_true", help="only run the parity check on existing exports")
+    args = parser.parse_args()
+
+    model, class_names = load_checkpoint(args.checkpoint, "cpu")
+    with open(class_names_path(args.checkpoint), "w") as f:
+        json.dump(class_names, f)
+
+    if not args.skip_export:
+        for backend in args.backends:
+            print(f"Exporting {backend}...")
+            export(model, class_names, backend, args)
+
+    if args.holdout_dir and not check_parity(model, class_names, args.backends, args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
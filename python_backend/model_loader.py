@@ -0,0 +1,84 @@
+import json
+import os
+from typing import List, Tuple
+
+import torch
+import torch.nn as nn
+from torchvision import models
+
+# Serving backends for the crop disease model. Everything except "eager" is an
+# artifact produced next to the checkpoint by model_export.py.
+BACKENDS = ["eager", "torchscript", "dynamic_int8", "static_int8", "onnx"]
+
+EXPORT_SUFFIXES = {
+    "torchscript": ".torchscript.pt",
+    "dynamic_int8": ".dynamic_int8.pt",
+    "static_int8": ".static_int8.pt",
+    "onnx": ".onnx",
+}
+
+
+def build_model(num_classes: int) -> nn.Module:
+    """MobileNetV2 with the classifier head resized for our classes."""
+    model = models.mobilenet_v2(weights=None)
+    model.classifier[1] = nn.Linear(model.last_channel, num_classes)
+    return model
+
+
+def load_checkpoint(path: str, device: str = "cpu") -> Tuple[nn.Module, List[str]]:
+    """Loads the training checkpoint ({'class_names', 'model_state'}) as an eager float32 model."""
+    checkpoint = torch.load(path, map_location=device)
+    class_names = checkpoint["class_names"]
+    model = build_model(len(class_names))
+    model.load_state_dict(checkpoint["model_state"])
+    model.to(device)
+    model.eval()
+    return model, class_names
+
+
+def export_path(checkpoint_path: str, backend: str) -> str:
+    return os.path.splitext(checkpoint_path)[0] + EXPORT_SUFFIXES[backend]
+
+
+def class_names_path(checkpoint_path: str) -> str:
+    return os.path.splitext(checkpoint_path)[0] + ".classes.json"
+
+
+class OnnxModel:
+    """Wraps an onnxruntime session so it takes and returns tensors like the torch backends."""
+
+    def __init__(self, path: str):
+        import onnxruntime as ort  # optional: only needed for MODEL_BACKEND=onnx
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        (logits,) = self.session.run(None, {self.input_name: batch.cpu().numpy()})
+        return torch.from_numpy(logits)
+
+
+def load_serving_model(checkpoint_path: str, backend: str = "eager", device: str = "cpu"):
+    """
+    Returns (model, class_names) for `backend`. The exported backends are CPU only
+    and read their class names from the .classes.json written by model_export.py.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}', expected one of {BACKENDS}")
+    if backend == "eager":
+        return load_checkpoint(checkpoint_path, device)
+
+    path = export_path(checkpoint_path, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found, run model_export.py --backends {backend} first")
+    with open(class_names_path(checkpoint_path)) as f:
+        class_names = json.load(f)
+
+    if backend == "onnx":
+        return OnnxModel(path), class_names
+
+    model = torch.jit.load(path, map_location="cpu")
+    model.eval()
+    return model, class_names
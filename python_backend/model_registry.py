@@ -0,0 +1,260 @@
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import database
+import torch_threads
+from metrics import LatencyStats
+
+
+class LoadedModel:
+    """One loaded, warmed-up checkpoint version. Requests keep a reference for their whole forward."""
+
+    def __init__(self, name: str, version: str, path: str, backend: str, model, class_names: List[str],
+                 device: str, load_seconds: float):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.backend = backend
+        self.model = model
+        self.class_names = class_names
+        self.device = device
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+
+def checkpoint_version(path: str) -> str:
+    """Default version label: the checkpoint's modification time."""
+    return datetime.datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y%m%d-%H%M%S")
+
+
+class ModelRegistry:
+    """
+    Named crop disease checkpoints (e.g. per crop or region), each serving one
+    current version. `load()` builds a new version on a background loader thread,
+    warms it up and then swaps it in by replacing the dict entry, so requests
+    already holding the previous LoadedModel finish on it. A failed load leaves
+    the current version (and its registered path) serving.
+
+    `register()` records a new path/version or a new name in the shared
+    `model_registrations` table. With `watch_interval` set, every uvicorn
+    worker's watcher applies new registrations and reloads a model whenever its
+    checkpoint file changes, so all workers converge within one interval.
+    """
+
+    def __init__(self, models: Dict[str, str], default: str, backend: str = "eager",
+                 watch_interval: Optional[float] = None):
+        self.paths = dict(models)
+        self.default = default
+        self.backend = backend
+        self.watch_interval = watch_interval if watch_interval is not None else float(os.getenv("MODEL_WATCH_INTERVAL", "60"))
+
+        self._current: Dict[str, LoadedModel] = {}
+        self._loading: Dict[str, str] = {}        # name -> version being loaded
+        self._loading_paths: Dict[str, str] = {}  # name -> checkpoint being loaded
+        self._errors: Dict[str, str] = {}
+        self._mtimes: Dict[str, float] = {}       # checkpoint path -> mtime of the last load attempt
+        self._applied: Dict[str, float] = {}      # name -> updated_at of the last registration applied
+        self.latency: Dict[str, LatencyStats] = {}  # "name@version" -> stats
+        self._lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+        self._watcher = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, default_path: str, backend: str = "eager") -> "ModelRegistry":
+        """
+        Reads the MODEL_REGISTRY JSON manifest, {"default": name, "models": {name: path}}
+        with paths relative to the manifest, or serves `default_path` as "default".
+        """
+        manifest_path = os.getenv("MODEL_REGISTRY")
+        if not manifest_path:
+            return cls({"default": default_path}, "default", backend)
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        base = os.path.dirname(os.path.abspath(manifest_path))
+        models = {name: os.path.join(base, path) for name, path in manifest["models"].items()}
+        return cls(models, manifest.get("default", next(iter(models))), backend)
+
+    def get(self, name: Optional[str] = None) -> Optional[LoadedModel]:
+        """The current version of `name` (default model if None), or None while it isn't loaded."""
+        name = name or self.default
+        if name not in self.paths and name not in self._loading and name not in self._errors:
+            raise KeyError(name)
+        return self._current.get(name)
+
+    def state(self, name: Optional[str] = None) -> str:
+        name = name or self.default
+        if name in self._current:
+            return "ready"
+        if name in self._loading:
+            return "loading"
+        if name in self._errors:
+            return "failed"
+        return "not_loaded"
+
+    def error(self, name: Optional[str] = None) -> Optional[str]:
+        return self._errors.get(name or self.default)
+
+    def start(self):
+        """Loads every registered model that hasn't been loaded yet; later calls are no-ops."""
+        self.sync_registrations()
+        for name in list(self.paths):
+            if self.state(name) == "not_loaded":
+                self.load(name)
+
+    def load(self, name: str, path: Optional[str] = None, version: Optional[str] = None) -> str:
+        """Schedules a background load of `path` (the registered checkpoint by default) as `name`."""
+        with self._lock:
+            path = path or self.paths.get(name)
+            if not path:
+                raise KeyError(name)
+            if name in self._loading:
+                return self._loading[name]
+            if not version:
+                version = checkpoint_version(path) if os.path.exists(path) else "missing"
+            self._loading[name] = version
+            self._loading_paths[name] = path
+        self._loader.submit(self._load, name, path, version)
+        return version
+
+    def _load(self, name: str, path: str, version: str):
+        started = time.perf_counter()
+        try:
+            self._mtimes[path] = os.path.getmtime(path) if os.path.exists(path) else 0
+            import torch
+            from model_loader import load_serving_model
+
+            torch_threads.configure()
+            # The exported backends are compiled for CPU serving
+            device = "cuda" if torch.cuda.is_available() and self.backend == "eager" else "cpu"
+            print(f"Loading model '{name}' version {version} from {path} on {device} ({self.backend} backend)...")
+            model, class_names = load_serving_model(path, self.backend, device)
+
+            # The first forward pass allocates buffers (and optimizes TorchScript graphs),
+            # so run it here rather than on a farmer's request
+            with torch.no_grad():
+                model(torch.zeros(1, 3, 224, 224, device=device))
+
+            loaded = LoadedModel(name, version, path, self.backend, model, class_names, device,
+                                 round(time.perf_counter() - started, 2))
+            with self._lock:
+                self.latency.setdefault(f"{name}@{version}", LatencyStats())
+                self._current[name] = loaded
+                self.paths[name] = path
+                self._errors.pop(name, None)
+            print(f"Model '{name}' version {version} ready in {loaded.load_seconds}s ({len(class_names)} classes)")
+        except Exception as e:
+            print(f"Error loading model '{name}' version {version}: {e}")
+            self._errors[name] = str(e)
+        finally:
+            self._loading.pop(name, None)
+            self._loading_paths.pop(name, None)
+
+        # A worker starting up with a broken registration falls back to the manifest checkpoint
+        fallback = self.paths.get(name)
+        if name not in self._current and fallback and fallback != path:
+            print(f"Falling back to {fallback} for model '{name}'")
+            self.load(name, fallback)
+
+    def record_latency(self, loaded: LoadedModel, ms: float):
+        self.latency[f"{loaded.name}@{loaded.version}"].record(ms)
+
+    def status(self) -> dict:
+        models = {}
+        for name in {**self.paths, **self._loading, **self._errors}:
+            current = self._current.get(name)
+            models[name] = {
+                "state": self.state(name),
+                "path": self.paths.get(name),
+                "loading_path": self._loading_paths.get(name),
+                "version": current.version if current else None,
+                "loading_version": self._loading.get(name),
+                "error": self._errors.get(name),
+                "load_seconds": current.load_seconds if current else None,
+                "classes": len(current.class_names) if current else None,
+            }
+        return {
+            "default": self.default,
+            "backend": self.backend,
+            "models": models,
+            "latency": {key: stats.summary() for key, stats in self.latency.items()},
+        }
+
+    def register(self, name: str, path: Optional[str] = None, version: Optional[str] = None) -> str:
+        """
+        Records `name` -> `path` (its current checkpoint by default) for every worker
+        and starts loading it here; the other workers pick it up on their next watch.
+        """
+        path = path or self.paths.get(name) or self._registered_path(name)
+        if not path:
+            raise KeyError(name)
+        now = time.time()
+        with database.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO model_registrations (name, path, version, updated_at) VALUES (?, ?, ?, ?)",
+                (name, path, version, now)
+            )
+        if name not in self._loading:
+            # Otherwise the watcher applies it once the load in progress finishes
+            self._applied[name] = now
+        return self.load(name, path, version)
+
+    def _registered_path(self, name: str) -> Optional[str]:
+        row = database.get_connection().execute(
+            "SELECT path FROM model_registrations WHERE name = ?", (name,)
+        ).fetchone()
+        return row["path"] if row else None
+
+    def sync_registrations(self) -> bool:
+        """Loads registrations made (by any worker) since this worker last looked. True if any were new."""
+        rows = database.get_connection().execute(
+            "SELECT name, path, version, updated_at FROM model_registrations"
+        ).fetchall()
+        changed = False
+        for row in rows:
+            if row["updated_at"] <= self._applied.get(row["name"], 0) or row["name"] in self._loading:
+                continue
+            self._applied[row["name"]] = row["updated_at"]
+            print(f"Applying registration of model '{row['name']}' from {row['path']}")
+            self.load(row["name"], row["path"], row["version"])
+            changed = True
+        return changed
+
+    def check_for_updates(self):
+        """Applies new registrations and reloads every model whose checkpoint changed since its last load attempt."""
+        self.sync_registrations()
+        for name, path in list(self.paths.items()):
+            if name in self._loading or path not in self._mtimes or not os.path.exists(path):
+                continue
+            if os.path.getmtime(path) != self._mtimes[path]:
+                print(f"Checkpoint for model '{name}' changed, reloading")
+                self.load(name)
+
+    def start_watcher(self):
+        if self._watcher or self.watch_interval <= 0:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.watch_interval):
+                try:
+                    self.check_for_updates()
+                except Exception as e:
+                    print(f"Model watcher error: {e}")
+
+        self._watcher = threading.Thread(target=run, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        self._watcher = None
+
+    def shutdown(self):
+        self.stop_watcher()
+        self._loader.shutdown(wait=False)
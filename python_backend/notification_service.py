@@ -1,13 +1,68 @@
-
+import itertools
 import os
-from twilio.rest import Client
+import random
+import threading
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+class TwilioTransport:
+    """
+    Sends SMS through the Twilio REST API and returns the message SID. The twilio
+    package is imported on the first send, so it doesn't slow down worker startup.
+    """
+
+    def __init__(self, account_sid: str, auth_token: str):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from twilio.rest import Client
+                self._client = Client(self.account_sid, self.auth_token)
+            return self._client
+
+    def send(self, to_number: str, from_number: str, body: str) -> str:
+        message = self.client.messages.create(
+            body=body,
+            from_=from_number,
+            to=to_number
+        )
+        return message.sid
+
+class FakeTwilioTransport:
+    """
+    Local stand-in for Twilio (SMS_TRANSPORT=fake) for development and load tests.
+    Records every message instead of sending it; latency and failure rate can be
+    tuned to exercise retries.
+    """
+
+    def __init__(self, latency: float = None, fail_rate: float = None):
+        self.latency = latency if latency is not None else float(os.getenv("FAKE_SMS_LATENCY", "0"))
+        self.fail_rate = fail_rate if fail_rate is not None else float(os.getenv("FAKE_SMS_FAIL_RATE", "0"))
+        self.sent = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def send(self, to_number: str, from_number: str, body: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            raise RuntimeError("Fake transport: simulated delivery failure")
+        with self._lock:
+            sid = f"SMfake{next(self._ids):08d}"
+            self.sent.append({"sid": sid, "to": to_number, "from": from_number, "body": body})
+        print(f"[fake sms] {sid} -> {to_number}: {body}")
+        return sid
+
 class NotificationService:
-    def __init__(self):
+    def __init__(self, transport=None):
         # We rely on 'TWILIO_ACCOUNT_SID' and 'TWILIO_AUTH_TOKEN' being present in .env
         # Check standard env vars first
         self.account_sid = os.getenv('TWILIO_ACCOUNT_SID')
@@ -22,30 +77,34 @@ class NotificationService:
         # IF the library can infer the account or if we are using it for basic SMS.
         # But 'Messages.create' requires an Account Context.
         # If this fails, the user MUST provide the real Account SID (starts with 'AC').
-        
-        self.client = None
-        if self.account_sid and self.auth_token:
-            try:
-                self.client = Client(self.account_sid, self.auth_token)
-            except Exception as e:
-                print(f"Twilio Client Init Error: {e}")
+        if self.account_sid and self.account_sid.startswith("SK"):
+            print("WARNING: Using API Key SID ('SK...') as Account SID might fail for SMS without explicit AccountContext.")
 
-    def send_sms(self, to_number: str, body: str) -> bool:
-        if not self.client:
-            print("Twilio client not initialized. Check .env")
-            return False
+        self.transport = transport
+        if self.transport is None:
+            if os.getenv('SMS_TRANSPORT') == 'fake':
+                self.transport = FakeTwilioTransport()
+            elif self.account_sid and self.auth_token:
+                try:
+                    self.transport = TwilioTransport(self.account_sid, self.auth_token)
+                except Exception as e:
+                    print(f"Twilio Client Init Error: {e}")
+
+    def deliver(self, to_number: str, body: str) -> str:
+        """Sends one SMS and returns the provider message SID; raises on failure."""
+        if not self.transport:
+            raise RuntimeError("Twilio client not initialized. Check .env")
 
+        # Ensure number has + prefix
+        if not to_number.startswith('+'):
+            to_number = '+' + to_number
+
+        return self.transport.send(to_number, self.from_number, body)
+
+    def send_sms(self, to_number: str, body: str) -> bool:
         try:
-            # Ensure number has + prefix
-            if not to_number.startswith('+'):
-                to_number = '+' + to_number
-                
-            message = self.client.messages.create(
-                body=body,
-                from_=self.from_number,
-                to=to_number
-            )
-            print(f"SMS sent: {message.sid}")
+            sid = self.deliver(to_number, body)
+            print(f"SMS sent: {sid}")
             return True
         except Exception as e:
             print(f"Failed to send SMS to {to_number}: {e}")
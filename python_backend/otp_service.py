@@ -1,14 +1,184 @@
-
+import heapq
+import os
 import random
 import hashlib
+import threading
 import time
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
+
+import database
+
+# (hashed_otp, expiry_timestamp, attempts)
+OTPEntry = Tuple[str, float, int]
+
+# Failed guesses allowed per OTP
+MAX_ATTEMPTS = 3
+
+# Outcomes of OTPStore.consume()
+VERIFIED, INVALID, NOT_FOUND, EXPIRED, LOCKED = "verified", "invalid", "not_found", "expired", "locked"
+
+class MemoryOTPStore:
+    """
+    Single-process OTP store. Expired entries are dropped lazily on read and by
+    `sweep()`, which pops a min-heap of expiry times so it only touches entries
+    that are actually due. Holds at most `max_entries` OTPs; past that the ones
+    closest to expiry are evicted first.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("OTP_MAX_ENTRIES", "100000"))
+        self._entries: Dict[str, OTPEntry] = {}
+        self._expiry_heap = []  # (expiry, phone); may hold stale items for regenerated OTPs
+        self._lock = threading.Lock()
+
+    def _pop_soonest(self):
+        expiry, phone = heapq.heappop(self._expiry_heap)
+        entry = self._entries.get(phone)
+        if entry and entry[1] == expiry:
+            del self._entries[phone]
+
+    def put(self, phone: str, hashed_otp: str, expiry: float):
+        with self._lock:
+            self._entries[phone] = (hashed_otp, expiry, 0)
+            heapq.heappush(self._expiry_heap, (expiry, phone))
+            while len(self._entries) > self.max_entries:
+                self._pop_soonest()
+            # Drop stale heap items once they outnumber live entries
+            if len(self._expiry_heap) > 2 * len(self._entries) + 64:
+                self._expiry_heap = [(entry[1], phone) for phone, entry in self._entries.items()]
+                heapq.heapify(self._expiry_heap)
+
+    def get(self, phone: str) -> Optional[OTPEntry]:
+        with self._lock:
+            return self._entries.get(phone)
+
+    def consume(self, phone: str, hashed_otp: str, now: float, max_attempts: int = MAX_ATTEMPTS) -> str:
+        """Checks a guess and deletes the OTP on success, or counts the failed attempt, in one step."""
+        with self._lock:
+            entry = self._entries.get(phone)
+            if entry is None:
+                return NOT_FOUND
+            if now > entry[1]:
+                del self._entries[phone]
+                return EXPIRED
+            if entry[2] >= max_attempts:
+                del self._entries[phone]
+                return LOCKED
+            if hashed_otp == entry[0]:
+                del self._entries[phone]
+                return VERIFIED
+            self._entries[phone] = (entry[0], entry[1], entry[2] + 1)
+            return INVALID
+
+    def delete(self, phone: str):
+        with self._lock:
+            self._entries.pop(phone, None)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        with self._lock:
+            before = len(self._entries)
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                self._pop_soonest()
+            return before - len(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteOTPStore:
+    """
+    OTP store in the shared `otp_codes` table, so an OTP generated on one uvicorn
+    worker verifies on any other. `sweep()` deletes expired rows via the expiry
+    index and trims the table to `max_entries`.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("OTP_MAX_ENTRIES", "100000"))
+
+    def put(self, phone: str, hashed_otp: str, expiry: float):
+        with database.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO otp_codes (phone, hashed_otp, expiry, attempts) VALUES (?, ?, ?, 0)",
+                (phone, hashed_otp, expiry)
+            )
+
+    def get(self, phone: str) -> Optional[OTPEntry]:
+        row = database.get_connection().execute(
+            "SELECT hashed_otp, expiry, attempts FROM otp_codes WHERE phone = ?", (phone,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def consume(self, phone: str, hashed_otp: str, now: float, max_attempts: int = MAX_ATTEMPTS) -> str:
+        """
+        Checks a guess and deletes the OTP on success, or counts the failed attempt.
+        BEGIN IMMEDIATE serializes guesses across threads and workers, so parallel
+        guesses can't all see the same attempt count and a code verifies only once.
+        """
+        conn = database.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT hashed_otp, expiry, attempts FROM otp_codes WHERE phone = ?", (phone,)
+            ).fetchone()
+            if row is None:
+                result = NOT_FOUND
+            elif now > row["expiry"]:
+                result = EXPIRED
+            elif row["attempts"] >= max_attempts:
+                result = LOCKED
+            elif hashed_otp == row["hashed_otp"]:
+                result = VERIFIED
+            else:
+                result = INVALID
+
+            if result == INVALID:
+                conn.execute("UPDATE otp_codes SET attempts = attempts + 1 WHERE phone = ?", (phone,))
+            elif result != NOT_FOUND:
+                conn.execute("DELETE FROM otp_codes WHERE phone = ?", (phone,))
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+
+    def delete(self, phone: str):
+        with database.transaction() as conn:
+            conn.execute("DELETE FROM otp_codes WHERE phone = ?", (phone,))
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        with database.transaction() as conn:
+            removed = conn.execute("DELETE FROM otp_codes WHERE expiry <= ?", (now,)).rowcount
+            removed += conn.execute('''
+                DELETE FROM otp_codes WHERE phone IN (
+                    SELECT phone FROM otp_codes ORDER BY expiry
+                    LIMIT MAX(0, (SELECT COUNT(*) FROM otp_codes) - ?)
+                )
+            ''', (self.max_entries,)).rowcount
+        return removed
+
+    def __len__(self):
+        return database.get_connection().execute("SELECT COUNT(*) FROM otp_codes").fetchone()[0]
+
+OTP_STORES = {"memory": MemoryOTPStore, "sqlite": SQLiteOTPStore}
+
+VERIFY_MESSAGES = {
+    VERIFIED: "Success",
+    INVALID: "Invalid OTP",
+    NOT_FOUND: "OTP not found or expired",
+    EXPIRED: "OTP expired",
+    LOCKED: "Too many failed attempts",
+}
 
 class OTPService:
-    def __init__(self):
-        # In-memory storage: phone -> (hashed_otp, expiry_timestamp, attempts)
-        self.otp_storage: Dict[str, Tuple[str, float, int]] = {}
+    def __init__(self, store=None):
+        # Default to the shared SQLite store so OTPs work behind multiple workers;
+        # OTP_STORE=memory keeps them in this process only.
+        self.store = store or OTP_STORES[os.getenv("OTP_STORE", "sqlite")]()
         self.SALT = "ruralx_hackathon_secret_salt"  # In prod, use env var
+        self.sweep_interval = float(os.getenv("OTP_SWEEP_INTERVAL", "60"))
+        self._sweeper = None
+        self._stop = threading.Event()
 
     def _hash_otp(self, otp: str) -> str:
         return hashlib.sha256((otp + self.SALT).encode()).hexdigest()
@@ -17,29 +187,35 @@ class OTPService:
         otp = str(random.randint(100000, 999999))
         expiry = time.time() + 300  # 5 minutes
         hashed_otp = self._hash_otp(otp)
-        
+
         # Store OTP with 0 attempts
-        self.otp_storage[phone] = (hashed_otp, expiry, 0)
+        self.store.put(phone, hashed_otp, expiry)
         return otp
 
     def verify_otp(self, phone: str, otp_input: str) -> Tuple[bool, str]:
-        if phone not in self.otp_storage:
-            return False, "OTP not found or expired"
-
-        hashed_stored_otp, expiry, attempts = self.otp_storage[phone]
-
-        if time.time() > expiry:
-            del self.otp_storage[phone]
-            return False, "OTP expired"
-
-        if attempts >= 3:
-            del self.otp_storage[phone]
-            return False, "Too many failed attempts"
-
-        if self._hash_otp(otp_input) == hashed_stored_otp:
-            del self.otp_storage[phone]  # Verify only once
-            return True, "Success"
-        
-        # Increment attempts
-        self.otp_storage[phone] = (hashed_stored_otp, expiry, attempts + 1)
-        return False, "Invalid OTP"
+        # The store checks and updates the entry atomically, so an OTP verifies only once
+        # and concurrent guesses share the attempt limit
+        result = self.store.consume(phone, self._hash_otp(otp_input), time.time())
+        return result == VERIFIED, VERIFY_MESSAGES[result]
+
+    def start_sweeper(self):
+        """Periodically evicts expired OTPs so abandoned signups don't pile up."""
+        if self._sweeper:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.sweep_interval):
+                try:
+                    removed = self.store.sweep()
+                    if removed:
+                        print(f"OTP sweep removed {removed} expired entries")
+                except Exception as e:
+                    print(f"OTP sweep error: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="otp-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        self._sweeper = None
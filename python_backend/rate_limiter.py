@@ -0,0 +1,156 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+import database
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket per key: each key allows bursts of `capacity` requests and
+    refills at `refill_per_sec`. State is two floats per key, updated in O(1).
+
+    Keys are kept in least-recently-used order; a key idle long enough for its
+    bucket to be full again is indistinguishable from a new key, so it is
+    dropped. `max_keys` caps memory if an attacker rotates keys faster than that.
+    """
+
+    blocking = False
+
+    def __init__(self, capacity: float, refill_per_sec: float, max_keys: int = 100000):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.max_keys = max_keys
+        self.idle_ttl = capacity / refill_per_sec
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, last_seen)
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._buckets:
+            key, (_, last_seen) = next(iter(self._buckets.items()))
+            if now - last_seen < self.idle_ttl and len(self._buckets) <= self.max_keys:
+                break
+            self._buckets.popitem(last=False)
+
+    def allow(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """Returns (allowed, seconds until `cost` tokens are available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last_seen = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last_seen) * self.refill_per_sec)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._expire(now)
+
+        retry_after = 0.0 if allowed else (cost - tokens) / self.refill_per_sec
+        return allowed, retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteTokenBucketLimiter:
+    """
+    Same token buckets as TokenBucketLimiter, kept in the shared `rate_limit_buckets`
+    table so a limit holds across every uvicorn worker instead of once per
+    process. `name` namespaces the keys of one limiter. Each check is one short
+    BEGIN IMMEDIATE transaction, so only use it from threadpool code, not the
+    event loop (RateLimitMiddleware runs it on the threadpool). Buckets idle long
+    enough to be full again are swept lazily.
+    """
+
+    blocking = True
+
+    def __init__(self, name: str, capacity: float, refill_per_sec: float):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.idle_ttl = capacity / refill_per_sec
+        self._last_sweep = 0.0
+
+    def allow(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """Returns (allowed, seconds until `cost` tokens are available)."""
+        key = f"{self.name}:{key}"
+        now = time.time()
+        conn = database.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = self.capacity
+            if row:
+                tokens = min(self.capacity, row["tokens"] + max(0.0, now - row["updated_at"]) * self.refill_per_sec)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            if now - self._last_sweep > self.idle_ttl:
+                self._last_sweep = now
+                conn.execute(
+                    "DELETE FROM rate_limit_buckets WHERE key >= ? AND key < ? AND updated_at < ?",
+                    (f"{self.name}:", f"{self.name};", now - self.idle_ttl)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        retry_after = 0.0 if allowed else (cost - tokens) / self.refill_per_sec
+        return allowed, retry_after
+
+    def __len__(self):
+        return database.get_connection().execute(
+            "SELECT COUNT(*) FROM rate_limit_buckets WHERE key >= ? AND key < ?", (f"{self.name}:", f"{self.name};")
+        ).fetchone()[0]
+
+
+def too_many_requests(retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Too many requests. Please try again later."},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware that sheds requests to `paths` per client IP before the
+    request body is read or any endpoint code runs. Limiters that block on I/O
+    (the SQLite one) are checked on the threadpool to keep the event loop free.
+    """
+
+    def __init__(self, app, limiter, paths: Iterable[str], trust_proxy_headers: bool = False):
+        self.app = app
+        self.limiter = limiter
+        self.paths = frozenset(paths)
+        self.trust_proxy_headers = trust_proxy_headers
+
+    def client_ip(self, scope) -> str:
+        if self.trust_proxy_headers:
+            for name, value in scope.get("headers", []):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client: Optional[tuple] = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            if self.limiter.blocking:
+                allowed, retry_after = await run_in_threadpool(self.limiter.allow, self.client_ip(scope))
+            else:
+                allowed, retry_after = self.limiter.allow(self.client_ip(scope))
+            if not allowed:
+                await too_many_requests(retry_after)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+from PIL import Image
+
+
+def normalize_prompt(text: str) -> str:
+    """Folds case, punctuation and whitespace so trivially different phrasings share a key."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def normalize_history(history: List[dict]) -> str:
+    turns = []
+    for turn in history:
+        parts = turn.get("parts", [])
+        if isinstance(parts, str):
+            parts = [parts]
+        text = " ".join(p if isinstance(p, str) else p.get("text", "") for p in parts)
+        turns.append(f"{turn.get('role', '')}:{normalize_prompt(text)}")
+    return "\n".join(turns)
+
+
+def perceptual_hash(image: Image.Image) -> str:
+    """64-bit difference hash: stable across re-encoding, resizing and small edits."""
+    small = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def cache_key(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache for generated text, bounded by the total size of the stored
+    values in bytes. With `disk_path` set, entries are also written to a SQLite
+    file that is consulted on a memory miss, so the cache survives restarts.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None, disk_path: Optional[str] = None):
+        self.max_bytes = max_bytes or int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.ttl = ttl if ttl is not None else float(os.getenv("GEMINI_CACHE_TTL", str(24 * 3600)))
+        self.disk_path = disk_path if disk_path is not None else os.getenv("GEMINI_CACHE_DISK_PATH")
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._disk = None
+        if self.disk_path:
+            self._disk = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            with self._disk:
+                self._disk.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+
+    def _store(self, key: str, value: str, expires_at: float):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old:
+            self._bytes -= old[1]
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+                self._bytes -= entry[1]
+
+            if self._disk:
+                row = self._disk.execute(
+                    "SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row:
+                    self._store(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._disk:
+                with self._disk:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, value, expires_at)
+                    )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "disk_tier": bool(self._disk),
+        }
@@ -0,0 +1,176 @@
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import database
+
+
+class SMSQueue:
+    """
+    Persistent outbound SMS queue backed by the `sms_outbox` table.
+
+    `enqueue` only inserts a row, so request handlers return immediately. A pool
+    of background worker threads claims due messages (BEGIN IMMEDIATE makes the
+    claim safe across threads and uvicorn workers), delivers them through
+    NotificationService, and reschedules failures with exponential backoff until
+    SMS_MAX_ATTEMPTS is reached. Sends to the same destination, including ones
+    still in flight on another worker, are spaced at least
+    SMS_PER_DESTINATION_INTERVAL seconds apart.
+
+    A claim is a lease: a message left in 'sending' for longer than
+    SMS_CLAIM_TIMEOUT seconds (its worker died mid-send) goes back to the queue
+    and counts as an attempt. Keep the timeout well above the provider's request
+    timeout, or a slow send can go out twice.
+    """
+
+    def __init__(
+        self,
+        notification_service,
+        workers: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        base_backoff: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+        per_destination_interval: Optional[float] = None,
+        claim_timeout: Optional[float] = None,
+        poll_interval: float = 0.5,
+    ):
+        self.notification_service = notification_service
+        self.workers = workers or int(os.getenv("SMS_WORKERS", "4"))
+        self.max_attempts = max_attempts or int(os.getenv("SMS_MAX_ATTEMPTS", "5"))
+        self.base_backoff = base_backoff if base_backoff is not None else float(os.getenv("SMS_BASE_BACKOFF", "2"))
+        self.max_backoff = max_backoff if max_backoff is not None else float(os.getenv("SMS_MAX_BACKOFF", "300"))
+        self.per_destination_interval = (
+            per_destination_interval if per_destination_interval is not None
+            else float(os.getenv("SMS_PER_DESTINATION_INTERVAL", "1"))
+        )
+        self.claim_timeout = claim_timeout or float(os.getenv("SMS_CLAIM_TIMEOUT", "120"))
+        self.poll_interval = poll_interval
+
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+    def enqueue(self, to_number: str, body: str) -> int:
+        with database.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO sms_outbox (to_number, body, status, attempts, next_attempt_at, created_at)
+                VALUES (?, ?, 'pending', 0, ?, ?)
+            ''', (to_number, body, time.time(), time.time()))
+            message_id = cursor.lastrowid
+        self._wakeup.set()
+        return message_id
+
+    def status(self, message_id: int) -> Optional[dict]:
+        row = database.get_connection().execute('''
+            SELECT id, to_number, status, attempts, last_error, provider_sid, created_at, sent_at
+            FROM sms_outbox WHERE id = ?
+        ''', (message_id,)).fetchone()
+        return dict(row) if row else None
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"sms-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _release_expired(self, conn, now: float):
+        """Requeues messages whose worker died mid-send (lease older than claim_timeout)."""
+        conn.execute('''
+            UPDATE sms_outbox
+            SET status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END,
+                attempts = attempts + 1, next_attempt_at = ?, claimed_at = NULL,
+                last_error = 'Send did not complete within the claim timeout'
+            WHERE status = 'sending' AND claimed_at < ?
+        ''', (self.max_attempts, now, now - self.claim_timeout))
+
+    def _claim(self) -> Optional[dict]:
+        conn = database.get_connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._release_expired(conn, now)
+            row = conn.execute('''
+                SELECT id, to_number, body, attempts FROM sms_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT 1
+            ''', (now,)).fetchone()
+            if row is None:
+                conn.commit()
+                return None
+
+            # Messages still being sent count from when they were claimed
+            last_sent = conn.execute('''
+                SELECT MAX(CASE status WHEN 'sent' THEN sent_at ELSE claimed_at END) FROM sms_outbox
+                WHERE to_number = ? AND status IN ('sending', 'sent')
+            ''', (row["to_number"],)).fetchone()[0]
+            if last_sent is not None and now - last_sent < self.per_destination_interval:
+                # Too soon for this destination: push it back without using up an attempt
+                conn.execute(
+                    "UPDATE sms_outbox SET next_attempt_at = ? WHERE id = ?",
+                    (last_sent + self.per_destination_interval, row["id"])
+                )
+                conn.commit()
+                return {"deferred": True}
+
+            conn.execute("UPDATE sms_outbox SET status = 'sending', claimed_at = ? WHERE id = ?", (now, row["id"]))
+            conn.commit()
+            return {**dict(row), "claimed_at": now}
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"SMS queue claim error: {e}")
+                self._stop.wait(self.poll_interval)
+                continue
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            if job.get("deferred"):
+                continue
+
+            attempts = job["attempts"] + 1
+            try:
+                sid = self.notification_service.deliver(job["to_number"], job["body"])
+            except Exception as e:
+                print(f"Failed to send SMS {job['id']} to {job['to_number']} (attempt {attempts}): {e}")
+                if attempts >= self.max_attempts:
+                    status, next_attempt_at = "failed", None
+                else:
+                    status, next_attempt_at = "pending", time.time() + self._backoff(attempts)
+                # Only while we still hold the lease, so a requeued message isn't rescheduled twice
+                with database.transaction() as conn:
+                    conn.execute('''
+                        UPDATE sms_outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?,
+                               claimed_at = NULL
+                        WHERE id = ? AND status = 'sending' AND claimed_at = ?
+                    ''', (status, attempts, next_attempt_at, str(e), job["id"], job["claimed_at"]))
+            else:
+                # Record the delivery even if the lease expired, unless another worker has reclaimed it
+                with database.transaction() as conn:
+                    conn.execute('''
+                        UPDATE sms_outbox SET status = 'sent', attempts = ?, provider_sid = ?, sent_at = ?
+                        WHERE id = ? AND (status != 'sending' OR claimed_at = ?)
+                    ''', (attempts, sid, time.time(), job["id"], job["claimed_at"]))
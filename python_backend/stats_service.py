@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import database
+
+# Counters the admin dashboard shows next to the farmer totals, bumped via
+# StatsService.increment by the features that own them (broadcasts: pending_alerts).
+# Complaints aren't stored by the backend yet, so their counts aren't reported.
+DASHBOARD_COUNTERS = ["pending_alerts"]
+
+
+class StatsService:
+    """
+    Serves /admin/dashboard/stats from the incrementally maintained
+    `district_stats` and `stat_counters` tables instead of scanning `users`.
+
+    The write helpers take the caller's connection so they commit (or roll back)
+    together with the change they describe. Reads are cached in-process for up
+    to ADMIN_STATS_MAX_STALENESS seconds.
+    """
+
+    def __init__(self, max_staleness: Optional[float] = None):
+        self.max_staleness = max_staleness if max_staleness is not None else float(os.getenv("ADMIN_STATS_MAX_STALENESS", "30"))
+        self._cached = None
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _adjust_district(conn, location: str, delta: int):
+        conn.execute('''
+            INSERT INTO district_stats (location, farmers) VALUES (?, ?)
+            ON CONFLICT(location) DO UPDATE SET farmers = farmers + excluded.farmers
+        ''', (location, delta))
+        conn.execute("DELETE FROM district_stats WHERE location = ? AND farmers <= 0", (location,))
+
+    @staticmethod
+    def record_signup(conn, location: str):
+        StatsService._adjust_district(conn, location, 1)
+
+    @staticmethod
+    def record_location_change(conn, old_location: str, new_location: str):
+        if old_location == new_location:
+            return
+        StatsService._adjust_district(conn, old_location, -1)
+        StatsService._adjust_district(conn, new_location, 1)
+
+    @staticmethod
+    def increment(conn, name: str, delta: int = 1):
+        conn.execute('''
+            INSERT INTO stat_counters (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        ''', (name, delta))
+
+    def _compute(self) -> dict:
+        conn = database.get_connection()
+        district_data = [
+            {"district": row["location"], "farmers": row["farmers"]}
+            for row in conn.execute("SELECT location, farmers FROM district_stats ORDER BY location")
+        ]
+        counters = {row["name"]: row["value"] for row in conn.execute("SELECT name, value FROM stat_counters")}
+
+        stats = {"total_farmers": sum(d["farmers"] for d in district_data)}
+        for name in DASHBOARD_COUNTERS:
+            stats[name] = counters.get(name, 0)
+        stats["district_stats"] = district_data
+        return stats
+
+    def get_dashboard_stats(self) -> dict:
+        with self._lock:
+            if self._cached is None or time.monotonic() - self._cached_at > self.max_staleness:
+                self._cached = self._compute()
+                self._cached_at = time.monotonic()
+            return self._cached
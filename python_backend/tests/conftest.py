@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A freshly migrated database file per test."""
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "test.db"))
+    database.migrate()
+    yield database
+    database.close_all()
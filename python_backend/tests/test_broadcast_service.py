@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from broadcast_service import BroadcastService
+from notification_service import FakeTwilioTransport, NotificationService
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def add_farmers(db, count, location="Madurai"):
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (name, phone, location, role) VALUES (?, ?, ?, 'farmer')",
+            [(f"Farmer {i}", f"98765{i:05d}", location) for i in range(count)]
+        )
+
+
+def queue_broadcast(db, message="Pest alert"):
+    """Inserts a queued broadcast for every farmer, as if its creator crashed before starting it."""
+    with db.transaction() as conn:
+        broadcast_id = conn.execute('''
+            INSERT INTO broadcasts (channel, message, concurrency, max_rate, status, created_at)
+            VALUES ('sms', ?, 4, 1000, 'queued', ?)
+        ''', (message, time.time())).lastrowid
+        total = conn.execute('''
+            INSERT INTO broadcast_recipients (broadcast_id, phone) SELECT ?, phone FROM users
+        ''', (broadcast_id,)).rowcount
+        conn.execute("UPDATE broadcasts SET total = ? WHERE id = ?", (total, broadcast_id))
+    return broadcast_id
+
+
+def make_service(transport):
+    return BroadcastService(NotificationService(transport=transport))
+
+
+def test_one_worker_runs_a_resumed_broadcast(db):
+    add_farmers(db, 20)
+    broadcast_id = queue_broadcast(db)
+    transport = FakeTwilioTransport(latency=0.01, fail_rate=0)
+    workers = [make_service(transport), make_service(transport)]
+
+    for service in workers:
+        service.resume_incomplete()
+    assert wait_for(lambda: workers[0].progress(broadcast_id)["status"] == "completed")
+
+    progress = workers[0].progress(broadcast_id)
+    assert (progress["sent"], progress["pending"]) == (20, 0)
+    assert len(transport.sent) == 20
+
+
+def test_stale_claim_is_taken_over(db):
+    add_farmers(db, 5)
+    broadcast_id = queue_broadcast(db)
+    service = make_service(FakeTwilioTransport(latency=0, fail_rate=0))
+    with db.transaction() as conn:
+        conn.execute("UPDATE broadcasts SET status = 'running', owner = 'live', heartbeat = ? WHERE id = ?",
+                     (time.time(), broadcast_id))
+
+    # The owner is still heartbeating, so the broadcast is left alone
+    service.resume_incomplete()
+    time.sleep(0.1)
+    assert service.progress(broadcast_id)["sent"] == 0
+
+    with db.transaction() as conn:
+        conn.execute("UPDATE broadcasts SET heartbeat = ? WHERE id = ?",
+                     (time.time() - service.claim_timeout - 1, broadcast_id))
+    service.resume_incomplete()
+    assert wait_for(lambda: service.progress(broadcast_id)["status"] == "completed")
+    assert service.progress(broadcast_id)["sent"] == 5
+
+
+def test_broadcasts_do_not_leak_connections(db):
+    add_farmers(db, 10)
+    service = make_service(FakeTwilioTransport(latency=0, fail_rate=0))
+    service.progress(0)
+    before = len(db._connections)
+
+    for _ in range(5):
+        broadcast_id = queue_broadcast(db)
+        service.resume_incomplete()
+        assert wait_for(lambda: service.progress(broadcast_id)["status"] == "completed")
+        assert wait_for(lambda: broadcast_id not in service._runs)
+
+    assert len(db._connections) == before
+
+
+@pytest.mark.parametrize("options", [{"concurrency": 0}, {"concurrency": -4}, {"max_rate": 0}, {"max_rate": -1.5}])
+def test_non_positive_limits_are_rejected(db, options):
+    add_farmers(db, 3)
+    service = make_service(FakeTwilioTransport(latency=0, fail_rate=0))
+
+    with pytest.raises(ValueError):
+        service.create("Pest alert", **options)
+    assert db.get_connection().execute("SELECT COUNT(*) FROM broadcasts").fetchone()[0] == 0
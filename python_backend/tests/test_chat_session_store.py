@@ -0,0 +1,46 @@
+from chat_session_store import SUMMARY_PREFIX, ChatSessionStore, compact_turn, estimate_tokens
+
+
+def turns(*pairs):
+    return [compact_turn(role, text) for role, text in pairs]
+
+
+def test_oversized_single_exchange_is_truncated_not_summarized(db):
+    summarized = []
+    store = ChatSessionStore(token_budget=100, summarizer=lambda history: summarized.append(history) or "s")
+    session_id = store.create()
+
+    store.append_turn(session_id, "q" * 1000, "a" * 1000)
+    history = store.get_history(session_id)
+
+    assert [turn["role"] for turn in history] == ["user", "model"]
+    assert estimate_tokens(history) <= 100
+    assert history[0]["parts"][0].startswith("q") and history[1]["parts"][0].startswith("a")
+    assert summarized == []
+
+
+def test_compaction_cuts_at_user_turns_in_odd_length_history():
+    store = ChatSessionStore(token_budget=100, summarizer=lambda history: "earlier talk")
+    # The second question's reply failed, so it has no model turn
+    history = turns(
+        ("user", "first " * 40), ("model", "answer " * 40),
+        ("user", "unanswered " * 20),
+        ("user", "latest question"), ("model", "latest answer"),
+    )
+
+    compacted = store._compact(history)
+
+    assert compacted[0]["parts"][0] == SUMMARY_PREFIX + "earlier talk"
+    assert compacted[2:] == history[3:]
+    assert estimate_tokens(compacted) <= 100
+
+
+def test_summary_and_recent_turns_stay_within_budget():
+    store = ChatSessionStore(token_budget=100, summarizer=lambda history: "earlier talk")
+    history = turns(("user", "old " * 30), ("model", "old reply " * 30), ("user", "new " * 200), ("model", "ok"))
+
+    compacted = store._compact(history)
+
+    assert compacted[0]["parts"][0].startswith(SUMMARY_PREFIX)
+    assert [turn["role"] for turn in compacted[2:]] == ["user", "model"]
+    assert estimate_tokens(compacted) <= 100
@@ -0,0 +1,44 @@
+import threading
+
+
+def run_in_threads(db, count):
+    def query():
+        with db.transaction() as conn:
+            conn.execute("SELECT COUNT(*) FROM users").fetchone()
+
+    threads = [threading.Thread(target=query) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_connections_close_when_their_threads_exit(db):
+    baseline = db.open_connections()  # the test thread's, from migrating
+    # Like the endpoint thread pool retiring idle threads and starting new ones
+    for _ in range(3):
+        run_in_threads(db, 20)
+        assert db.open_connections() == baseline
+
+
+def test_close_all_closes_connections_of_live_threads(db):
+    opened, release = threading.Event(), threading.Event()
+    connections = []
+
+    def hold():
+        connections.append(db.get_connection())
+        opened.set()
+        release.wait(5)
+        # The thread's next query gets a fresh connection
+        connections.append(db.get_connection())
+        connections[-1].execute("SELECT 1").fetchone()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    opened.wait(5)
+    db.close_all()
+    assert db.open_connections() == 0
+
+    release.set()
+    thread.join()
+    assert connections[0] is not connections[1]
@@ -0,0 +1,60 @@
+import asyncio
+import io
+
+import httpx
+import pytest
+import torch
+from PIL import Image
+
+import main
+from image_processing import ORIENTATION_TAG
+from inference_batcher import InferenceBatcher
+from model_registry import LoadedModel
+
+
+class TopHalfBrighter(torch.nn.Module):
+    """Class 0 if the top half of the image is brighter than the bottom half, else class 1."""
+
+    def forward(self, batch):
+        half = batch.shape[2] // 2
+        top, bottom = batch[:, :, :half].mean(dim=(1, 2, 3)), batch[:, :, half:].mean(dim=(1, 2, 3))
+        return torch.stack([top - bottom, bottom - top], dim=1) * 100
+
+
+def rotated_photo() -> bytes:
+    """A 640x480 JPEG that is only upright (bright on top) once its EXIF orientation is applied."""
+    upright = Image.new("RGB", (480, 640), "black")
+    upright.paste((255, 255, 255), (0, 0, 240, 320))  # top-left quadrant
+    # Stored turned on its side, as phone cameras do; orientation 6 rotates it 90 degrees clockwise
+    stored = upright.transpose(Image.Transpose.ROTATE_90)
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6
+    buffer = io.BytesIO()
+    stored.save(buffer, format="JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def app(db, monkeypatch):
+    loaded = LoadedModel("default", "test", "", "eager", TopHalfBrighter().eval(),
+                         ["bright_top", "bright_bottom"], "cpu", 0.0)
+    monkeypatch.setattr(main, "resolve_model", lambda name: loaded)
+    monkeypatch.setattr(main.model_registry, "record_latency", lambda loaded, ms: None)
+    # The batcher's worker task belongs to one event loop; each test runs its own
+    monkeypatch.setattr(main, "predict_batcher", InferenceBatcher(
+        main.run_prediction_batch, executor=main.inference_executor.model_pool))
+    return main.app
+
+
+@pytest.mark.parametrize("mode", ["pil", "draft", "tensor"])
+def test_predict_and_diagnose_agree_on_exif_rotated_photo(app, monkeypatch, mode):
+    monkeypatch.setattr("image_processing.PREPROCESS_MODE", mode)
+    files = {"file": ("leaf.jpg", rotated_photo(), "image/jpeg")}
+
+    async def classify():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            predicted = await client.post("/predict", files=files)
+            diagnosed = await client.post("/diagnose", files=files, data={"threshold": "0"})
+        return predicted.json()["class"], diagnosed.json()["class"]
+
+    assert asyncio.run(classify()) == ("bright_top", "bright_top")
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import database
+from otp_service import OTPService, SQLiteOTPStore
+
+
+def make_service():
+    return OTPService(store=SQLiteOTPStore())
+
+
+def guess_in_parallel(service, phone, guesses, monkeypatch):
+    results = []
+    start = threading.Barrier(len(guesses))
+
+    # A slow hash widens the window between reading the entry and updating it
+    hash_otp = service._hash_otp
+    monkeypatch.setattr(service, "_hash_otp", lambda otp: time.sleep(0.02) or hash_otp(otp))
+
+    def guess(otp):
+        database.get_connection()  # open it before the race starts
+        start.wait()
+        results.append(service.verify_otp(phone, otp))
+
+    threads = [threading.Thread(target=guess, args=(otp,)) for otp in guesses]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_otp_verifies_once(db):
+    service = make_service()
+    otp = service.generate_otp("9876500001")
+
+    assert service.verify_otp("9876500001", otp) == (True, "Success")
+    assert service.verify_otp("9876500001", otp) == (False, "OTP not found or expired")
+
+
+def test_otp_is_locked_after_three_wrong_guesses(db):
+    service = make_service()
+    otp = service.generate_otp("9876500001")
+    wrong = "000000" if otp != "000000" else "111111"
+
+    for _ in range(3):
+        assert service.verify_otp("9876500001", wrong) == (False, "Invalid OTP")
+    assert service.verify_otp("9876500001", otp) == (False, "Too many failed attempts")
+
+
+def test_expired_otp_is_rejected(db):
+    service = make_service()
+    service.store.put("9876500001", service._hash_otp("123456"), time.time() - 1)
+
+    assert service.verify_otp("9876500001", "123456") == (False, "OTP expired")
+    assert service.store.get("9876500001") is None
+
+
+def test_parallel_guesses_share_the_attempt_limit(db, monkeypatch):
+    service = make_service()
+    otp = service.generate_otp("9876500001")
+    wrong = [f"{n:06d}" for n in range(12) if f"{n:06d}" != otp][:10]
+
+    results = guess_in_parallel(service, "9876500001", wrong, monkeypatch)
+    assert [message for _, message in results].count("Invalid OTP") == 3
+    assert service.verify_otp("9876500001", otp) == (False, "OTP not found or expired")
+
+
+def test_parallel_correct_guesses_verify_once(db, monkeypatch):
+    service = make_service()
+    otp = service.generate_otp("9876500001")
+
+    results = guess_in_parallel(service, "9876500001", [otp] * 8, monkeypatch)
+    assert [ok for ok, _ in results].count(True) == 1
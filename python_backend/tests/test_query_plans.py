@@ -0,0 +1,20 @@
+import pytest
+
+# Hot per-farmer queries -> (params, index their plan must use instead of scanning and sorting)
+HOT_QUERIES = {
+    "SELECT * FROM growth_records WHERE user_phone = ? ORDER BY sowing_date DESC":
+        (("9000000001",), "idx_growth_records_phone_sowing"),
+    "SELECT * FROM soil_memory WHERE user_phone = ? ORDER BY test_date ASC":
+        (("9000000001",), "idx_soil_memory_phone_test"),
+    "SELECT COUNT(*) FROM users WHERE location = ?":
+        (("Erode",), "idx_users_location"),
+}
+
+
+@pytest.mark.parametrize("query", HOT_QUERIES)
+def test_hot_query_uses_its_index(db, query):
+    params, index = HOT_QUERIES[query]
+    plan = " | ".join(row[3] for row in db.get_connection().execute(f"EXPLAIN QUERY PLAN {query}", params))
+
+    assert index in plan
+    assert "USE TEMP B-TREE" not in plan
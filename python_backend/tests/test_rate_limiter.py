@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from rate_limiter import RateLimitMiddleware, SQLiteTokenBucketLimiter
+
+
+def test_workers_share_one_bucket_per_key(db):
+    # Two limiters stand in for the same limit in two uvicorn workers
+    workers = [SQLiteTokenBucketLimiter("otp_send", capacity=3, refill_per_sec=1 / 3600) for _ in range(2)]
+
+    results = [workers[i % 2].allow("9876543210")[0] for i in range(6)]
+    assert results == [True, True, True, False, False, False]
+
+    allowed, retry_after = workers[0].allow("9876543210")
+    assert not allowed and retry_after > 3000
+    # Other phones and other limiters have their own buckets
+    assert workers[1].allow("9000000000")[0]
+    assert SQLiteTokenBucketLimiter("otp_verify", capacity=1, refill_per_sec=1).allow("9876543210")[0]
+
+
+def test_bucket_refills_over_time(db):
+    limiter = SQLiteTokenBucketLimiter("otp_verify", capacity=1, refill_per_sec=20)
+    assert [limiter.allow("9876543210")[0] for _ in range(2)] == [True, False]
+
+    time.sleep(0.06)  # one token back
+    assert limiter.allow("9876543210")[0]
+
+
+def test_ip_limit_is_shared_by_all_workers(db):
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    # One middleware per uvicorn worker, each with the full configured budget
+    workers = [
+        RateLimitMiddleware(endpoint, SQLiteTokenBucketLimiter("auth_ip", capacity=4, refill_per_sec=1 / 60),
+                            paths=["/auth/send-otp"])
+        for _ in range(2)
+    ]
+
+    async def request(worker):
+        statuses = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        scope = {"type": "http", "path": "/auth/send-otp", "client": ("203.0.113.7", 1234), "headers": []}
+        await worker(scope, None, send)
+        return statuses[0]
+
+    async def run():
+        # A client pinned to one worker gets the whole budget ...
+        pinned = [await request(workers[0]) for _ in range(4)]
+        # ... and spreading over workers doesn't add to it
+        spread = [await request(workers[i % 2]) for i in range(2)]
+        return pinned, spread
+
+    assert asyncio.run(run()) == ([200, 200, 200, 200], [429, 429])
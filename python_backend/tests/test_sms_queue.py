@@ -0,0 +1,116 @@
+import time
+
+from notification_service import FakeTwilioTransport, NotificationService
+from sms_queue import SMSQueue
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def make_queue(transport, **options):
+    options.setdefault("poll_interval", 0.01)
+    options.setdefault("per_destination_interval", 0)
+    return SMSQueue(NotificationService(transport=transport), **options)
+
+
+def test_enqueue_delivers_through_transport(db):
+    transport = FakeTwilioTransport(latency=0, fail_rate=0)
+    queue = make_queue(transport, workers=2)
+    queue.start()
+    try:
+        message_id = queue.enqueue("919876543210", "Your code is 123456")
+        assert wait_for(lambda: queue.status(message_id)["status"] == "sent")
+    finally:
+        queue.stop()
+
+    status = queue.status(message_id)
+    assert status["attempts"] == 1
+    assert transport.sent == [{"sid": status["provider_sid"], "to": "+919876543210", "from": None,
+                               "body": "Your code is 123456"}]
+
+
+def test_failed_send_is_retried_with_backoff(db):
+    transport = FakeTwilioTransport(latency=0, fail_rate=1)
+    queue = make_queue(transport, workers=1, base_backoff=0.5)
+    queue.start()
+    try:
+        message_id = queue.enqueue("919876543210", "hello")
+        assert wait_for(lambda: queue.status(message_id)["attempts"] == 1)
+        failed_at = time.time()
+        status = queue.status(message_id)
+        assert status["status"] == "pending"
+        assert "simulated delivery failure" in status["last_error"]
+
+        transport.fail_rate = 0
+        assert wait_for(lambda: queue.status(message_id)["status"] == "sent")
+        # The first backoff is base_backoff scaled by a jitter of 0.5-1.0
+        assert time.time() - failed_at >= 0.2
+    finally:
+        queue.stop()
+
+    assert queue.status(message_id)["attempts"] == 2
+    assert len(transport.sent) == 1
+
+
+def test_message_fails_after_max_attempts(db):
+    transport = FakeTwilioTransport(latency=0, fail_rate=1)
+    queue = make_queue(transport, workers=2, max_attempts=3, base_backoff=0.01)
+    queue.start()
+    try:
+        message_id = queue.enqueue("919876543210", "hello")
+        assert wait_for(lambda: queue.status(message_id)["status"] == "failed")
+        time.sleep(0.1)
+    finally:
+        queue.stop()
+
+    status = queue.status(message_id)
+    assert status["attempts"] == 3
+    assert status["sent_at"] is None
+    assert transport.sent == []
+
+
+def test_sends_to_one_destination_are_spaced(db):
+    # Slow sends on several workers: later messages must wait for the one in flight
+    transport = FakeTwilioTransport(latency=0.1, fail_rate=0)
+    queue = make_queue(transport, workers=4, per_destination_interval=0.3)
+    same = [queue.enqueue("919876543210", f"message {i}") for i in range(3)]
+    other = queue.enqueue("919000000000", "other farmer")
+    queue.start()
+    try:
+        assert wait_for(lambda: all(queue.status(i)["status"] == "sent" for i in same + [other]))
+    finally:
+        queue.stop()
+
+    sent_at = sorted(queue.status(i)["sent_at"] for i in same)
+    gaps = [later - earlier for earlier, later in zip(sent_at, sent_at[1:])]
+    assert min(gaps) >= 0.3
+    # Other destinations aren't held back by it
+    assert queue.status(other)["sent_at"] < sent_at[1]
+
+
+def test_only_expired_claims_are_requeued(db):
+    transport = FakeTwilioTransport(latency=0, fail_rate=0)
+    queue = make_queue(transport, workers=1, claim_timeout=60)
+    stale = queue.enqueue("919000000001", "claimed by a worker that died")
+    live = queue.enqueue("919000000002", "being sent by another worker")
+    with db.transaction() as conn:
+        conn.execute("UPDATE sms_outbox SET status = 'sending', claimed_at = ? WHERE id = ?", (time.time() - 120, stale))
+        conn.execute("UPDATE sms_outbox SET status = 'sending', claimed_at = ? WHERE id = ?", (time.time(), live))
+
+    queue.start()
+    try:
+        assert wait_for(lambda: queue.status(stale)["status"] == "sent")
+        time.sleep(0.1)
+    finally:
+        queue.stop()
+
+    # The expired claim counts as an attempt; the live one is left to its worker
+    assert queue.status(stale)["attempts"] == 2
+    assert queue.status(live)["status"] == "sending"
+    assert [message["to"] for message in transport.sent] == ["+919000000001"]
@@ -0,0 +1,66 @@
+import os
+import sys
+import threading
+from typing import Optional
+
+# Applied settings, reported by /predict/stats; empty until torch is configured
+settings = {}
+_lock = threading.Lock()
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects taskset/cgroup CPU affinity where supported)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def web_workers() -> int:
+    """uvicorn worker processes on this box; WEB_CONCURRENCY is also what uvicorn itself reads."""
+    return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def resolve_threads(value: str, workers: int) -> int:
+    """'auto' splits the cores evenly across the workers so they don't oversubscribe."""
+    if value == "auto":
+        return max(1, available_cores() // workers)
+    return max(1, int(value))
+
+
+def configure(num_threads: Optional[str] = None, interop_threads: Optional[str] = None) -> dict:
+    """
+    Sets torch's intra-op (TORCH_NUM_THREADS, default auto) and inter-op
+    (TORCH_INTEROP_THREADS, default 1) thread counts once per process. Call it
+    before the first forward; torch ignores later inter-op changes.
+    """
+    with _lock:
+        if settings:
+            return settings
+        import torch
+
+        workers = web_workers()
+        threads = resolve_threads(num_threads or os.getenv("TORCH_NUM_THREADS", "auto"), workers)
+        interop = resolve_threads(interop_threads or os.getenv("TORCH_INTEROP_THREADS", "1"), workers)
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(interop)
+        except RuntimeError as e:
+            # Already fixed by earlier parallel work in this process
+            print(f"Could not set torch inter-op threads: {e}")
+
+        settings.update(
+            cores=available_cores(),
+            web_workers=workers,
+            num_threads=torch.get_num_threads(),
+            interop_threads=torch.get_num_interop_threads(),
+        )
+        print(f"torch threads: {settings['num_threads']} intra-op, {settings['interop_threads']} inter-op "
+              f"({settings['cores']} cores, {workers} workers)")
+        return settings
+
+
+def single_threaded():
+    """Process pool initializer: preprocessing workers each get one torch thread."""
+    os.environ["OMP_NUM_THREADS"] = "1"
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(1)
@@ -53,6 +53,9 @@ export function ChatbotButton() {
   const [selectedImage, setSelectedImage] = useState<File | null>(null);
   const [previewUrl, setPreviewUrl] = useState<string | null>(null);
 
+  // Server-side chat session; once we have one, only the new message is sent
+  const chatSessionId = useRef<string | null>(null);
+
   // History for Backend
   // We need to map our frontend messages to { role: 'user' | 'model', parts: [text] }
   const getBackendHistory = () => {
@@ -148,12 +151,21 @@ export function ChatbotButton() {
         // but typically one appends it. Let's rely on backend to just take 'message' as current 
         // and 'history' as context.
 
-        const res = await fetch('http://localhost:8001/ai/chat', {
+        const sendChat = (body: object) => fetch('http://localhost:8001/ai/chat', {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ message: msgText, history: history })
+          body: JSON.stringify(body)
         });
+
+        let res = chatSessionId.current
+          ? await sendChat({ message: msgText, session_id: chatSessionId.current })
+          : await sendChat({ message: msgText, history: history });
+        if (res.status === 404) {
+          // Session expired on the server: start a new one from our local history
+          res = await sendChat({ message: msgText, history: history });
+        }
         const data = await res.json();
+        chatSessionId.current = data.session_id ?? null;
         botResponseText = data.response;
       }
 
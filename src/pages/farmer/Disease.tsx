@@ -68,7 +68,7 @@ export default function DiseaseDetection() {
         const formData = new FormData();
         formData.append('file', file);
 
-        const response = await fetch('http://localhost:8001/predict', {
+        const response = await fetch('http://localhost:8001/predict?top_k=6', {
           method: 'POST',
           body: formData,
           signal: controller.signal